@@ -0,0 +1,172 @@
+"""
+Pipeline benchmark for enerhabitat.
+
+Runs offline on synthetic EPW and materials files (see fixtures.py) and times every public
+stage: readEPW (uncached, cold cache and cache hit), meanDay and meanYear, Tsa and Tsa_grid,
+and solveCS across Nx, dt, wall types (layer count and thermal mass) and methods. It also
+records the peak memory of the 1 s resolution meanDay frame, the convergence iterations
+of the iterative solver and the mesh error estimate of the per-layer mesh, and compares
+timings and results with the stored baseline.
+
+    python benchmarks/bench_pipeline.py            # compare against the baseline
+    python benchmarks/bench_pipeline.py --update   # store the current results as baseline
+    python benchmarks/bench_pipeline.py --quick    # smaller solveCS grid
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+# With Numba's TBB threading layer the interpreter hangs on exit when h5py (loaded by pvlib)
+# is imported after a parallel kernel has run, so the benchmark prefers OpenMP
+os.environ.setdefault("NUMBA_THREADING_LAYER_PRIORITY", "omp tbb workqueue")
+
+import enerhabitat as eh
+from fixtures import WALLS, write_epw, write_materials
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pipeline_baseline.json")
+
+def timeit(funcion, repeat):
+    """
+    Returns the minimum wall time of repeat calls to funcion and the result of the last one.
+    """
+    tiempos = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - t)
+    return min(tiempos), resultado
+
+def peak_memory(funcion):
+    """
+    Returns the peak traced memory in MB while running funcion and its result.
+    """
+    tracemalloc.start()
+    try:
+        resultado = funcion()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return pico/2**20, resultado
+
+def run(directorio, repeat, quick):
+    epw = write_epw(os.path.join(directorio, "synthetic.epw"))
+    materiales = eh.Materials(write_materials(os.path.join(directorio, "materials.ini")))
+    cache = os.path.join(directorio, "cache")
+    tiempos, valores = {}, {}
+
+    sin_cache = eh.SimulationConfig(materials=materiales, cache=False)
+    eh.warmup(sin_cache)
+
+    tiempos["readEPW/no_cache"], _ = timeit(lambda: eh.readEPW(epw, cache=False), repeat)
+    tiempos["readEPW/cold"], _ = timeit(lambda: eh.readEPW(epw, cache=cache), 1)
+    tiempos["readEPW/hit"], _ = timeit(lambda: eh.readEPW(epw, cache=cache), repeat)
+
+    # Un EPW sin columnas de texto (banderas numéricas) también debe pasar por el caché
+    numerico = write_epw(os.path.join(directorio, "numeric_flags.epw"), flags=0)
+    esperado = eh.readEPW(numerico, cache=False)[0]
+    for intento in ("cold", "hit"):
+        if not eh.readEPW(numerico, cache=cache)[0].equals(esperado):
+            raise AssertionError(f"readEPW with numeric flags differs from the uncached read ({intento})")
+
+    con_cache = eh.SimulationConfig(materials=materiales, cache=cache)
+    dia = lambda resolution: eh.meanDay(epw, month="5", year="2024", resolution=resolution,
+                                        config=con_cache)
+    tiempos["meanDay/1s"], clima = timeit(lambda: dia(1), repeat)
+    tiempos["meanDay/600s"], _ = timeit(lambda: dia(600), repeat)
+    tiempos["meanYear/600s"], _ = timeit(
+        lambda: eh.meanYear(epw, year="2024", resolution=600, config=con_cache), repeat)
+    valores["meanDay/1s/peak_MB"], _ = peak_memory(lambda: dia(1))
+    valores["meanDay/1s/frame_MB"] = clima.memory_usage(deep=True).sum()/2**20
+    valores["meanDay/1s/Ta_mean"] = float(clima.Ta.mean())
+
+    tiempos["Tsa"], _ = timeit(lambda: eh.Tsa(clima.copy(), 0.7, 90, 180, config=con_cache), repeat)
+    tiempos["Tsa_grid/4x3"], _ = timeit(
+        lambda: eh.Tsa_grid(clima, [0.3, 0.5, 0.7], 90, [0, 90, 180, 270], config=con_cache),
+        repeat)
+
+    pasos = (600,) if quick else (60, 600)
+    nodos = (50, 200) if quick else (50, 100, 200)
+    for dt in pasos:
+        Tsa = eh.Tsa(dia(dt), 0.7, 90, 180, config=con_cache)
+        for Nx, (muro, sistema), method in itertools.product(nodos, WALLS.items(),
+                                                              ("iterative", "anderson", "direct")):
+            config = eh.SimulationConfig(Nx=Nx, dt=dt, materials=materiales, cache=cache)
+            nombre = f"solveCS/{method}/{muro}/Nx{Nx}/dt{dt}"
+            eh.solveCS(sistema, Tsa, method=method, config=config)
+            tiempos[nombre], Ti = timeit(
+                lambda: eh.solveCS(sistema, Tsa, method=method, config=config), repeat)
+            valores[nombre + "/Ti_max"] = float(Ti.max())
+            valores[nombre + "/iterations"] = Ti.attrs["iterations"]
+        for muro, sistema in WALLS.items():
+            config = eh.SimulationConfig(dt=dt, materials=materiales, cache=cache, mesh=eh.LayerMesh())
+            nombre = f"solveCS/direct/{muro}/layer_mesh/dt{dt}"
+            eh.solveCS(sistema, Tsa, method="direct", config=config)
+            tiempos[nombre], Ti = timeit(
+                lambda: eh.solveCS(sistema, Tsa, method="direct", config=config), repeat)
+            valores[nombre + "/Ti_max"] = float(Ti.max())
+            valores[nombre + "/mesh_error"] = eh.mesh_convergence(sistema, Tsa, config=config)
+        for muro, sistema in WALLS.items():
+            config = eh.SimulationConfig(dt=dt, materials=materiales, cache=cache)
+            nombre = f"solveCS_harmonic/{muro}/dt{dt}"
+            tiempos[nombre], Ti = timeit(
+                lambda: eh.solveCS_harmonic(sistema, Tsa, config=config), repeat)
+            valores[nombre + "/Ti_max"] = float(Ti.max())
+
+    return tiempos, valores
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--update", action="store_true", help="store the current results as baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="allowed slowdown factor over the baseline (default 1.5)")
+    parser.add_argument("--repeat", type=int, default=3, help="calls per timing")
+    parser.add_argument("--quick", action="store_true", help="run a smaller solveCS grid")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        tiempos, valores = run(directorio, args.repeat, args.quick)
+
+    for nombre, valor in tiempos.items():
+        print(f"{nombre:>48}: {1e3*valor:9.2f} ms")
+    for nombre, valor in valores.items():
+        print(f"{nombre:>48}: {valor:9.4g}")
+
+    fallas = []
+    if args.update or not os.path.isfile(BASELINE):
+        with open(BASELINE, "w") as f:
+            json.dump({"times": tiempos, "values": valores}, f, indent=2)
+        print(f"baseline stored in {BASELINE}")
+    else:
+        with open(BASELINE) as f:
+            base = json.load(f)
+        for nombre, valor in tiempos.items():
+            anterior = base["times"].get(nombre)
+            # 1 ms de holgura para que el ruido en las etapas cortas no cuente como regresión
+            if anterior is not None and valor > args.tolerance*anterior + 1e-3:
+                fallas.append(f"{nombre} took {1e3*valor:.2f} ms, baseline {1e3*anterior:.2f} ms")
+        for nombre, valor in valores.items():
+            anterior = base["values"].get(nombre)
+            if anterior is None:
+                continue
+            if nombre.endswith("_MB"):
+                if valor > args.tolerance*anterior:
+                    fallas.append(f"{nombre} is {valor:.1f} MB, baseline {anterior:.1f} MB")
+            elif nombre.endswith("/iterations"):
+                if valor > anterior:
+                    fallas.append(f"{nombre} needed {valor} iterations, baseline {anterior}")
+            elif not np.isclose(valor, anterior, rtol=1e-6, atol=1e-6):
+                fallas.append(f"{nombre} is {valor:.6f}, baseline {anterior:.6f}")
+
+    for falla in fallas:
+        print(f"REGRESSION: {falla}")
+    return 1 if fallas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
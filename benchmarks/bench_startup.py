@@ -0,0 +1,96 @@
+"""
+Startup-time benchmark for enerhabitat.
+
+Measures in fresh interpreters the time to import the package and the time until the
+first solveCS result (import + warmup + one solve of a synthetic wall), and compares
+them with the stored baseline. It also checks that importing enerhabitat does not
+import pvlib, which is only loaded when solar position or irradiance are needed.
+
+    python benchmarks/bench_startup.py            # compare against the baseline
+    python benchmarks/bench_startup.py --update   # store the current timings as baseline
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_baseline.json")
+
+IMPORT = """
+import sys, time
+t = time.perf_counter()
+import enerhabitat
+print(time.perf_counter() - t)
+print(int('pvlib' in sys.modules))
+"""
+
+FIRST_RESULT = """
+import sys, time
+t = time.perf_counter()
+import numpy as np, pandas as pd
+import enerhabitat as eh
+config = eh.SimulationConfig(materials=eh.Materials(sys.argv[1]))
+eh.warmup(config)
+index = pd.date_range("2024-05-15 00:00", periods=144, freq="600s", tz="Etc/GMT+6")
+Tsa = pd.DataFrame({"Tsa": 25 + 10*np.sin(2*np.pi*np.arange(144)/144), "Tn": 25.0}, index=index)
+eh.solveCS([("concrete", 0.1)], Tsa, config=config)
+print(time.perf_counter() - t)
+"""
+
+def run(code, *args, repeat=5):
+    """
+    Runs code in fresh interpreters and returns the minimum of the first printed value
+    together with the remaining output lines of the last run.
+    """
+    tiempos = []
+    for _ in range(repeat):
+        salida = subprocess.run([sys.executable, "-c", code, *args], check=True,
+                                capture_output=True, text=True).stdout.split()
+        tiempos.append(float(salida[0]))
+    return min(tiempos), salida[1:]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--update", action="store_true", help="store the current timings as baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="allowed slowdown factor over the baseline (default 1.5)")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per measurement")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        materiales = os.path.join(directorio, "materials.ini")
+        with open(materiales, "w") as f:
+            f.write("[concrete]\nk = 1.35\nrho = 1800\nc = 1000\n")
+
+        # La primera corrida llena el caché de Numba en disco
+        run(FIRST_RESULT, materiales, repeat=1)
+        import_time, (pvlib_loaded,) = run(IMPORT, repeat=args.repeat)
+        first_result, _ = run(FIRST_RESULT, materiales, repeat=args.repeat)
+
+    resultados = {"import": import_time, "first_result": first_result}
+    for nombre, valor in resultados.items():
+        print(f"{nombre:>14}: {valor:.3f} s")
+
+    fallas = []
+    if pvlib_loaded == "1":
+        fallas.append("importing enerhabitat imports pvlib")
+
+    if args.update or not os.path.isfile(BASELINE):
+        with open(BASELINE, "w") as f:
+            json.dump(resultados, f, indent=2)
+        print(f"baseline stored in {BASELINE}")
+    else:
+        with open(BASELINE) as f:
+            base = json.load(f)
+        for nombre, valor in resultados.items():
+            if nombre in base and valor > args.tolerance * base[nombre]:
+                fallas.append(f"{nombre} took {valor:.3f} s, baseline {base[nombre]:.3f} s")
+
+    for falla in fallas:
+        print(f"REGRESSION: {falla}")
+    return 1 if fallas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
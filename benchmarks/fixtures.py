@@ -0,0 +1,66 @@
+"""
+Synthetic inputs for the enerhabitat benchmarks.
+
+The EPW files are deterministic for a given seed: a seasonal and daily sinusoid for the
+dry bulb temperature and a clear-sky-like bell for the irradiance, so the benchmarks run
+offline and always simulate the same climate.
+"""
+import datetime
+
+import numpy as np
+
+MATERIALS = {
+    "concrete": (1.35, 1800, 1000),
+    "adobe": (0.58, 1500, 1480),
+    "brick": (0.70, 1970, 800),
+    "eps": (0.04, 15, 1300),
+}
+
+WALLS = {
+    "light": [("eps", 0.05)],
+    "medium": [("brick", 0.12)],
+    "heavy": [("concrete", 0.30)],
+    "four_layers": [("adobe", 0.02), ("eps", 0.04), ("concrete", 0.10), ("adobe", 0.02)],
+}
+
+def write_materials(path):
+    """
+    Writes a materials INI file with the materials used by WALLS.
+    """
+    with open(path, "w") as f:
+        for nombre, (k, rho, c) in MATERIALS.items():
+            f.write(f"[{nombre}]\nk = {k}\nrho = {rho}\nc = {c}\n\n")
+    return path
+
+def write_epw(path, lat=18.85, lon=-99.23, tz=-6, alt=1280, year=2019, seed=0,
+              flags="?9?9?9?9E0?9?9?9?9?9?9?9?9?9?9?9?9?9?9?9*9*9?9?9?9"):
+    """
+    Writes a full year (8760 hours) EPW file with a synthetic climate. flags is the
+    "Data Source and Uncertainty Flags" field of every record.
+    """
+    rng = np.random.default_rng(seed)
+    lineas = [f"LOCATION,Synthetic,MOR,MEX,SYN,000000,{lat},{lon},{tz:.1f},{alt}",
+              "DESIGN CONDITIONS,0",
+              "TYPICAL/EXTREME PERIODS,0",
+              "GROUND TEMPERATURES,0",
+              "HOLIDAYS/DAYLIGHT SAVINGS,No,0,0,0",
+              "COMMENTS 1,synthetic weather file",
+              "COMMENTS 2,generated by benchmarks/fixtures.py",
+              "DATA PERIODS,1,1,Data,Sunday, 1/ 1,12/31"]
+    inicio = datetime.datetime(year, 1, 1)
+    for h in range(8760):
+        fecha = inicio + datetime.timedelta(hours=h)
+        hora = fecha.hour
+        dia = fecha.timetuple().tm_yday
+        To = (20 + 5*np.sin(2*np.pi*dia/365) + 6*np.sin(2*np.pi*(hora - 9)/24)
+              + rng.normal(0, 0.5))
+        sol = max(0.0, np.sin(np.pi*(hora - 6)/12)) if 6 <= hora <= 18 else 0.0
+        Ig, Ib, Id = 900*sol, 700*sol, 150*sol
+        fila = [fecha.year, fecha.month, fecha.day, hora + 1, 60,
+                flags,
+                f"{To:.1f}", 10.0, 50, 85000, 0, 1415, 300, int(Ig), int(Ib), int(Id),
+                0, 0, 0, 0, 180, 2.0, 5, 3, 20.0, 77777, 9, 999999999, 20, 0.1, 0, 88, 0.2, 0, 0]
+        lineas.append(",".join(map(str, fila)))
+    with open(path, "w") as f:
+        f.write("\n".join(lineas) + "\n")
+    return path
@@ -1,8 +1,10 @@
-import pvlib
 import pytz
+import time
+import dataclasses
 
 from datetime import datetime
 from .ehtools import *
+from .ehtools import _results_cache
 
 La = 2.5    # Length of the dummy frame
 Nx = 200     # Number of elements to discretize
@@ -10,65 +12,207 @@ ho = 13     # Outside convection heat transfer
 hi = 8.6    # Inside convection heat transfer
 dt = 600     # Time step in seconds
 
+def _config(config):
+    """
+    Returns the given SimulationConfig, or one built from the module values.
+    """
+    if config is None:
+        return SimulationConfig(La=La, Nx=Nx, ho=ho, hi=hi, dt=dt)
+    return config
+
+def warmup(config = None):
+    """
+    Compiles (or loads from the on-disk cache) the Numba kernels used by solveCS,
+    solveCS_batch and solveRoom, so the first simulation does not pay the compilation time. Call it
+    once at the start of short-lived processes.
+
+    Args:
+        config (SimulationConfig, optional): Simulation configuration. Defaults to the module values.
+    """
+    config = _config(config)
+    material = Material(1.0, 1000.0, 1000.0)
+    cs = {"L1": {"L": 0.1, "material": material}}
+
+    # Mismos tipos que usan solveCS (perfiles de solo lectura) y solveCS_batch
+    k, rhoc, dx = set_k_rhoc(cs, 3)
+    perfil_k, perfil_rhoc = k.copy(), rhoc.copy()
+    perfil_k.flags.writeable = False
+    perfil_rhoc.flags.writeable = False
+    Tsa = np.full(2, 20.0)
+
+    solve_periodic(Tsa, perfil_k, perfil_rhoc, dx, 3, np.full(3, 20.0), np.full(2, 20.0),
+                   config.ho, config.hi, config.La, config.dt)
+    solve_periodic_anderson(Tsa, perfil_k, perfil_rhoc, dx, 3, np.full(3, 20.0), np.full(2, 20.0),
+                            config.ho, config.hi, config.La, config.dt)
+    solve_periodic_direct(Tsa, perfil_k, perfil_rhoc, dx, 3, config.ho, config.La, config.dt)
+    factorize_TDMA(config.dt, dx, perfil_k, 3, perfil_rhoc, config.ho, config.hi)
+    nodos = np.array([3])
+    solve_periodic_batch(Tsa[None, :], k[None, :], rhoc[None, :], np.full((1, 3), dx), nodos,
+                         np.full((1, 3), 20.0), np.full((1, 2), 20.0), config.ho, config.hi, config.La, config.dt)
+    solve_periodic_direct_batch(Tsa[None, :], k[None, :], rhoc[None, :], np.full((1, 3), dx), nodos,
+                                np.full((1, 3), 20.0), np.full((1, 2), 20.0), config.ho, config.La, config.dt)
+    solve_periodic_AC(Tsa, perfil_k, perfil_rhoc, dx, 3, np.full(3, 20.0), np.full(2, 20.0),
+                      np.full(2, 18.0), np.full(2, 22.0), config.ho, config.hi, config.La, config.dt)
+    solve_periodic_AC_batch(Tsa[None, :], k[None, :], rhoc[None, :], np.full((1, 3), dx), nodos,
+                            np.full((1, 3), 20.0), np.full((1, 2), 20.0), np.full((1, 2), 18.0),
+                            np.full((1, 2), 22.0), config.ho, config.hi, config.La, config.dt)
+    solve_room_periodic(Tsa[None, :], k[None, :], rhoc[None, :], np.full((1, 3), dx), nodos, np.ones(1),
+                        np.full((1, 3), 20.0), np.full(2, 20.0), config.ho, config.hi, config.La, config.dt)
+    calculate_DtaTn(10.0)
+
 def meanDay(
     epw_file : str,
     day = "15",
     month = "current_month",
-    year = "current_year"
+    year = "current_year",
+    resolution = 1,
+    config = None,
+    diagnostics = None
     ) -> pd.DataFrame:
     """
-    Calculates the ambient temperature per second for the average day based on EPW file data.
+    Calculates the ambient temperature for the average day based on EPW file data.
     
     Args:
         epw_file (str): Path to the EPW file. 
         day (str, optional): Day of interest. Defaults to 15.
         month (str, optional): Month of interest. Defaults to current month.
         year (str, optional): Year of interest. Defaults to current year.
+        resolution (int, optional): Time step of the average day in seconds. Use the solver
+            time step ( dt ) to compute only the rows solveCS uses. Defaults to 1.
+        config (SimulationConfig, optional): Simulation configuration. Defaults to the module values.
+        diagnostics (dict or callable, optional): Receives the seconds spent reading the EPW file,
+            computing the solar position, the temperature model and the irradiance interpolation
+            under "timings". A dictionary is updated in place, a function is called with them.
 
     Returns:
         DataFrame: Predicted ambient temperature ( Ta ), global ( Ig ), beam ( Ib ) 
-        and diffuse irradiance ( Id ) per second for the average day of the specified month and year.
+        and diffuse irradiance ( Id ) every resolution seconds for the average day of the specified month and year.
     """
     
     if month == "current_month": month = datetime.now().month
+
+    return meanYear(epw_file, [month], day, year, resolution, config, diagnostics)[int(month)]
+
+def meanYear(
+    epw_file : str,
+    months = range(1, 13),
+    day = "15",
+    year = "current_year",
+    resolution = 1,
+    config = None,
+    diagnostics = None
+    ) -> dict:
+    """
+    Calculates the average day of several months parsing the EPW file only once. The
+    solar position of all the months is computed in a single call and the monthly
+    temperature and irradiance statistics in single group-by operations.
+
+    Args:
+        epw_file (str): Path to the EPW file.
+        months (list, optional): Months of interest. Defaults to all the months.
+        day (str, optional): Day of interest. Defaults to 15.
+        year (str, optional): Year of interest. Defaults to current year.
+        resolution (int, optional): Time step of the average day in seconds. Defaults to 1.
+        config (SimulationConfig, optional): Simulation configuration. Defaults to the module values.
+        diagnostics (dict or callable, optional): Receives the stage timings, see meanDay.
+
+    Returns:
+        dict: meanDay DataFrame of each month, keyed by month number.
+    """
+
+    config = _config(config)
     if year == "current_year": year = datetime.now().year
+    months = [int(month) for month in months]
+    tiempos = dict.fromkeys(["read_epw", "solar_position", "temperature_model", "irradiance"], 0.0)
+
+    # Months memoized before are taken from the cache and only the rest are computed
+    resultados, claves = {}, {}
+    directorio = results_dir(config.cache)
+    if config.memoize:
+        huella = EPW_hash(epw_file)
+        for month in months:
+            claves[month] = result_key("meanDay", huella, month, int(day), int(year), resolution,
+                                        SOLAR_POSITION_STEP)
+            guardado = _results_cache.get(claves[month], directorio)
+            if guardado is not None:
+                resultados[month] = guardado.copy()
+    pendientes = [month for month in months if month not in resultados]
+    if not pendientes:
+        report_diagnostics(diagnostics, tiempos)
+        return resultados
+
+    t = time.perf_counter()
+    epw, latitud, longitud, altitud, timezone = readEPW(epw_file,year,alias=True,warns=False,cache=config.cache)
+    tiempos["read_epw"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    temperaturas = calculate_tTmaxTminTmax_months(epw)
+    tiempos["temperature_model"] += time.perf_counter() - t
+    t = time.perf_counter()
+    irradiancias = hourly_irradiance_months(epw)
+    tiempos["irradiance"] += time.perf_counter() - t
+
+    dias = _average_days(latitud, longitud, altitud, timezone, temperaturas, irradiancias,
+                         pendientes, day, year, resolution, tiempos)
+    for month, dia_promedio in dias.items():
+        resultados[month] = dia_promedio
+        if config.memoize:
+            _results_cache.put(claves[month], dia_promedio.copy(), directorio)
+
+    report_diagnostics(diagnostics, tiempos)
+    return {month: resultados[month] for month in months}
+
+def _average_days(latitud, longitud, altitud, timezone, temperaturas, irradiancias, months, day, year, resolution, tiempos):
+    """
+    Builds the meanDay DataFrames of the given months from the monthly temperature
+    statistics (calculate_tTmaxTminTmax_months) and hourly irradiance means
+    (hourly_irradiance_months), adding the seconds of each stage to tiempos.
+    """
+
+    import pvlib
 
-    f1 = f'{year}-{month}-{day} 00:00'
-    f2 = f'{year}-{month}-{day} 23:59'
-    
-    epw, latitud, longitud, altitud, timezone = readEPW(epw_file,year,alias=True,warns=False)
     timezone=pytz.timezone('Etc/GMT'+f'{(-timezone):+}')
-    
-    dia_promedio = pd.date_range(start=f1, end=f2, freq='1s',tz=timezone)
+
+    fechas = {month: (f'{year}-{month}-{day} 00:00', f'{year}-{month}-{day} 23:59') for month in months}
     location = pvlib.location.Location(latitude = latitud, 
                                        longitude=longitud, 
                                        altitude=altitud,
                                        tz=timezone)
 
-    dia_promedio = location.get_solarposition(dia_promedio)
-    del dia_promedio['apparent_zenith']
-    del dia_promedio['apparent_elevation']
-    
-    sunrise,_ = get_sunrise_sunset_times(dia_promedio)
-    tTmax,Tmin,Tmax = calculate_tTmaxTminTmax(month, epw)
+    t = time.perf_counter()
+    soles = solar_days(location, [f'{year}-{month}-{day}' for month in months], resolution)
+    tiempos["solar_position"] += time.perf_counter() - t
 
-    # Calculate ambient temperature y add to the DataFrame
-    dia_promedio = add_temperature_model(dia_promedio, Tmin, Tmax, sunrise, tTmax)
-    
-    # Add Ig, Ib, Id y Tn a dia_promedio 
-    dia_promedio = add_IgIbId_Tn(dia_promedio, epw, month, f1, f2, timezone)
-    
-    # Add DeltaTn
-    DeltaTa= dia_promedio.Ta.max() - dia_promedio.Ta.min()
-    dia_promedio['DeltaTn'] = calculate_DtaTn(DeltaTa)
-    
-    return dia_promedio
+    resultados = {}
+    for month, (dia_promedio, sunrise, _) in zip(months, soles):
+        f1, f2 = fechas[month]
+
+        t = time.perf_counter()
+        tTmax,Tmin,Tmax = temperaturas.loc[month, ['tTmax', 'Tmin', 'Tmax']]
+
+        # Calculate ambient temperature y add to the DataFrame
+        dia_promedio = add_temperature_model(dia_promedio, Tmin, Tmax, sunrise, tTmax)
+        tiempos["temperature_model"] += time.perf_counter() - t
+
+        # Add Ig, Ib, Id y Tn a dia_promedio 
+        t = time.perf_counter()
+        dia_promedio = add_IgIbId_Tn(dia_promedio, None, month, f1, f2, timezone, Irr=irradiancias.loc[month])
+        tiempos["irradiance"] += time.perf_counter() - t
+
+        # Add DeltaTn
+        DeltaTa= dia_promedio.Ta.max() - dia_promedio.Ta.min()
+        dia_promedio['DeltaTn'] = calculate_DtaTn(DeltaTa)
+
+        resultados[month] = dia_promedio
+
+    return resultados
 
 def Tsa(
     meanDay_dataframe:pd.DataFrame,
     solar_absortance: float,
     surface_tilt: float,
     surface_azimuth: float,
+    config = None
     ) -> pd.DataFrame: 
     """
     Calculates the sun-air temperature per second for the average day experienced
@@ -79,14 +223,27 @@ def Tsa(
         solar_absortance (float): Solar absortance of the system's external material.
         surface_tilt (float): Surface tilt relative to the ground, 90° == Vertical.
         surface_azimuth (float): Deviation from true north, 0° == North.
+        config (SimulationConfig, optional): Simulation configuration. Defaults to the module values.
     
     Returns:
         DataFrame: Predicted sun-air temperature ( Tsa ) and solar irradiance ( Is )
         per second for the average day.
     """
     
-    global ho
-    outside_convection_heat_transfer = ho
+    import pvlib
+
+    config = _config(config)
+    outside_convection_heat_transfer = config.ho
+
+    if config.memoize:
+        columnas = [meanDay_dataframe[c].to_numpy(dtype=float) for c in ['Ta', 'Ig', 'Ib', 'Id', 'zenith', 'azimuth']]
+        clave = result_key("Tsa", *columnas, solar_absortance, surface_tilt, surface_azimuth,
+                           outside_convection_heat_transfer)
+        directorio = results_dir(config.cache)
+        guardado = _results_cache.get(clave, directorio)
+        if guardado is not None:
+            meanDay_dataframe['Is'], meanDay_dataframe['Tsa'] = guardado
+            return meanDay_dataframe
     
     if surface_tilt == 0:
         LWR = 3.9
@@ -108,13 +265,81 @@ def Tsa(
     
     # Add Tsa
     meanDay_dataframe['Tsa'] = meanDay_dataframe.Ta + meanDay_dataframe.Is*solar_absortance/outside_convection_heat_transfer - LWR
+
+    if config.memoize:
+        _results_cache.put(clave, (meanDay_dataframe['Is'].to_numpy(copy=True),
+                                   meanDay_dataframe['Tsa'].to_numpy(copy=True)), directorio)
        
     return meanDay_dataframe
   
+def Tsa_grid(
+    meanDay_dataframe:pd.DataFrame,
+    solar_absortance,
+    surface_tilt,
+    surface_azimuth,
+    config = None
+    ) -> tuple:
+    """
+    Calculates the sun-air temperature for a grid of orientations and solar absortances
+    without modifying the meanDay dataframe. The surface irradiance of each orientation
+    is computed once and shared by all the absortances.
+
+    Args:
+        meanDay_dataframe (DataFrame): Data frame containing ambient temperature ( Ta ), global ( Ig ), direct ( Ib ) and diffuse irradiance ( Id ). 
+        solar_absortance (array_like): Solar absortances of the system's external material.
+        surface_tilt (array_like): Surface tilts relative to the ground, 90° == Vertical.
+        surface_azimuth (array_like): Deviations from true north, 0° == North. Tilts and azimuths
+            are broadcast against each other, each pair is one orientation.
+        config (SimulationConfig, optional): Simulation configuration. Defaults to the module values.
+
+    Returns:
+        tuple: (Is, Tsa) solar irradiance with shape (orientations, time) and sun-air
+        temperature with shape (orientations, absortances, time).
+    """
+    
+    import pvlib
+
+    outside_convection_heat_transfer = _config(config).ho
+
+    solar_absortance = np.atleast_1d(np.asarray(solar_absortance, dtype=np.float64))
+    surface_tilt, surface_azimuth = np.broadcast_arrays(np.atleast_1d(surface_tilt),
+                                                        np.atleast_1d(surface_azimuth))
+
+    Ib = meanDay_dataframe['Ib'].to_numpy()
+    Ig = meanDay_dataframe['Ig'].to_numpy()
+    Id = meanDay_dataframe['Id'].to_numpy()
+    zenith = meanDay_dataframe['zenith'].to_numpy()
+    azimuth = meanDay_dataframe['azimuth'].to_numpy()
+    Ta = meanDay_dataframe['Ta'].to_numpy()
+
+    Is = np.zeros((len(surface_tilt), len(Ta)))
+    LWR = np.where(surface_tilt == 0, 3.9, 0.)
+    for o, (tilt, surface_az) in enumerate(zip(surface_tilt, surface_azimuth)):
+        Is[o] = pvlib.irradiance.get_total_irradiance(
+            surface_tilt=tilt,
+            surface_azimuth=surface_az,
+            dni=Ib,
+            ghi=Ig,
+            dhi=Id,
+            solar_zenith=zenith,
+            solar_azimuth=azimuth
+        )['poa_global']
+
+    Tsa = Ta[None, None, :] + Is[:, None, :]*solar_absortance[None, :, None]/outside_convection_heat_transfer - LWR[:, None, None]
+
+    return Is, Tsa
+
 def solveCS(
     constructive_system:list,
     Tsa_dataframe:pd.DataFrame,
-    AC = False
+    AC = False,
+    method = "iterative",
+    config = None,
+    diagnostics = None,
+    T0 = None,
+    Ti0 = None,
+    warm_start = False,
+    setpoint = None
     )->pd.DataFrame:
     """
     Solves the constructive system's inside temperature with the Tsa simulation dataframe.
@@ -122,58 +347,428 @@ def solveCS(
     Args:
         constructive_system (list): list of tuples from outside to inside with material and width.
         Tsa_dataframe (DataFrame): Predicted sun-air temperature ( Tsa ) per second for the average day DataFrame.
+        AC (bool, optional): Keep the interior temperature within a comfort band with air
+            conditioning and compute its cooling and heating loads. Only available with the
+            "iterative" method. Defaults to False.
+        method (str, optional): "iterative" repeats the average day until the temperature profile
+            stops changing, "anderson" also extrapolates the state at the end of each day from
+            the previous days (Anderson acceleration), so it needs far fewer days, "direct"
+            computes the periodic solution with a single linear solve, so its cost does not
+            depend on the thermal mass. Defaults to "iterative".
+        config (SimulationConfig, optional): Simulation configuration. Defaults to the module values.
+        diagnostics (dict or callable, optional): Receives the seconds spent building the
+            material profile ("construction") and in the solver, TDMA factorization included
+            ("solve"), under "timings", the "iterations", the mean change of
+            each simulated day ("residuals") and the decrement factors "FD" (Ti swing over Ta
+            swing, NaN without Ta), "FDsa" (Ti swing over Tsa swing) and the number of cells
+            ("nodes"). A dictionary is updated in place, a function is called with them.
+        T0 (array_like, optional): Initial temperature profile with one value per cell (Nx
+            unless config.mesh is set) for the iterative methods. Defaults to the mean of Tn.
+        Ti0 (array_like, optional): Initial interior temperature at each time step for the
+            iterative methods. Defaults to the mean of Tn.
+        warm_start (bool, optional): Start the "anderson" method from the last solution of a
+            system with the same sequence of materials (any widths), mesh (Nx or LayerMesh), dt,
+            ho, hi and La, and store this solution for the next one. Useful in parametric sweeps.
+            A warm-started run stops at a 50 times tighter tolerance, so its result does not
+            depend on the calls made before it beyond 1e-4 °C. Not available with the
+            "iterative" method, whose criterion would stop wherever the previous solution was.
+            Defaults to False.
+        setpoint (float or tuple, optional): Air conditioning setpoint, a fixed temperature or
+            (lower, upper) limits. Defaults to the Tn ± DeltaTn band of meanDay.
         
     Returns:
-        DataFrame: Interior temperature ( Ti ) for the constructive system.
+        DataFrame: Interior temperature ( Ti ) for the constructive system. The mean change of the
+        temperature profile over the last simulated day is stored in attrs["residual"] and the
+        number of simulated days in attrs["iterations"] (1 for the direct method). With AC it also
+        has the heat flux from the wall into the room ( Qin ) and the air conditioning heat flux
+        ( Qac, positive when heating ) in W/m², and the daily energies in attrs["cooling"] and
+        attrs["heating"] in Wh/m².
     """
     
-    global La     # Length of the dummy frame
-    global Nx     # Number of elements to discretize
-    global ho     # Outside convection heat transfer
-    global hi     # Inside convection heat transfer
-    global dt     # Time step
+    config = _config(config)
+    La = config.La     # Length of the dummy frame
+    Nx = config.Nx     # Number of elements to discretize
+    ho = config.ho     # Outside convection heat transfer
+    hi = config.hi     # Inside convection heat transfer
+    dt = config.dt     # Time step
 
-    SC_dataframe = Tsa_dataframe.copy()
-       
-    propiedades = read_materials()
+    propiedades = config.properties()
     
-    cs = set_construction(propiedades, constructive_system)
-    k, rhoc, dx = set_k_rhoc(cs, Nx)
+    if method not in ("iterative", "anderson", "direct"):
+        raise ValueError(f"Unknown method {method!r}, use 'iterative', 'anderson' or 'direct'")
+    if AC and method != "iterative":
+        raise ValueError("AC is only available with the 'iterative' method")
+    if warm_start and method != "anderson":
+        raise ValueError("warm_start is only available with the 'anderson' method")
 
-    T = np.full(Nx, SC_dataframe.Tn.mean())
-    SC_dataframe['Ti'] = SC_dataframe.Tn.mean()
-    
-    SC_dataframe = SC_dataframe.iloc[::dt]
-    
-    C = 1
-    
-    if AC:  # AC = True
-        while C > 5e-4: 
-            Told = T.copy()
-            for tiempo, datos in SC_dataframe.iterrows():
-                a,b,c,d = calculate_coefficients(dt, dx, k, Nx, rhoc, T, datos["Tsa"], ho, datos["Ti"], hi)
-                # Llamado de funcion para Acc
-                T, Ti = solve_PQ_AC(a, b, c, d, T, Nx, datos['Ti'], hi, La, dt)
-                SC_dataframe.loc[tiempo,"Ti"] = Ti
-            Tnew = T.copy()
-            C = abs(Told - Tnew).mean()
-        #    FD   = (SC_dataframe.Ti.max() - SC_dataframe.Ti.min())/(SC_dataframe.Ta.max()-SC_dataframe.Ta.min())
-        #    FDsa = (SC_dataframe.Ti.max() - SC_dataframe.Ti.min())/(SC_dataframe.Tsa.max()-SC_dataframe.Tsa.min())
-
-        resultados = SC_dataframe['Ti']
+    t = time.perf_counter()
+    k, rhoc, dx = construction_profile(propiedades, constructive_system, Nx, config.mesh)
+    nx = len(k)        # Number of cells, Nx unless config.mesh is set
+    t_construccion = time.perf_counter() - t
+
+    SC_dataframe = sample_dataframe(Tsa_dataframe, dt)
+    Tsa_array = SC_dataframe['Tsa'].to_numpy(dtype=np.float64)
+
+    T = np.full(nx, Tsa_dataframe.Tn.mean())
+    Ti = np.full(len(Tsa_array), Tsa_dataframe.Tn.mean())
+    if warm_start:
+        inicial = get_warm_start(constructive_system, np.broadcast_to(dx, nx), len(Tsa_array),
+                                 Tsa_array.mean(), config)
+        if inicial is not None:
+            T, Ti = inicial
+    if T0 is not None:
+        T = np.array(T0, dtype=np.float64)
+    if Ti0 is not None:
+        Ti = np.array(Ti0, dtype=np.float64)
+    if T.shape != (nx,) or Ti.shape != Tsa_array.shape:
+        raise ValueError(f"T0 needs {nx} values and Ti0 {len(Tsa_array)} values")
+    if AC:
+        Tmin, Tmax = comfort_band(SC_dataframe, setpoint)
+
+    t = time.perf_counter()
+    if AC:
+        T, Ti, Qin, Qac, cooling, heating, residual, historia = solve_periodic_AC(
+            Tsa_array, k, rhoc, dx, nx, T, Ti, Tmin, Tmax, ho, hi, La, dt)
+    elif method == "iterative":
+        T, Ti, residual, historia = solve_periodic(Tsa_array, k, rhoc, dx, nx, T, Ti, ho, hi, La, dt)
+    elif method == "anderson":
+        # Desde una solución cercana el criterio usual se cumple casi de inmediato
+        tolerancia = 1e-5 if warm_start else 5e-4
+        T, Ti, residual, historia = solve_periodic_anderson(Tsa_array, k, rhoc, dx, nx, T, Ti, ho, hi, La, dt,
+                                                            5, tolerancia)
+    else:
+        T, Ti, residual = solve_periodic_direct(Tsa_array, k, rhoc, dx, nx, ho, La, dt)
+        historia = np.array([residual])
+    t_solucion = time.perf_counter() - t
+    if warm_start:
+        store_warm_start(constructive_system, np.broadcast_to(dx, nx), T, Ti, Tsa_array.mean(), config)
+
+    if AC:
+        resultados = pd.DataFrame({'Ti': Ti, 'Qin': Qin, 'Qac': Qac}, index=SC_dataframe.index)
+        resultados.attrs['cooling'] = cooling
+        resultados.attrs['heating'] = heating
+    else:
+        resultados = pd.Series(Ti, index=SC_dataframe.index, name='Ti')
+    resultados.attrs['residual'] = residual
+    resultados.attrs['iterations'] = len(historia)
+
+    if diagnostics is not None:
+        DeltaTi = Ti.max() - Ti.min()
+        FD = float(DeltaTi/(SC_dataframe.Ta.max() - SC_dataframe.Ta.min())) if 'Ta' in SC_dataframe else np.nan
+        FDsa = float(DeltaTi/(Tsa_array.max() - Tsa_array.min()))
+        report_diagnostics(diagnostics, {"construction": t_construccion, "solve": t_solucion},
+                           iterations=len(historia), residuals=historia, FD=FD, FDsa=FDsa, nodes=nx)
     
+    return resultados
+
+def solveCS_transient(
+    constructive_system:list,
+    epw_file:str,
+    solar_absortance:float,
+    surface_tilt:float,
+    surface_azimuth:float,
+    start = None,
+    end = None,
+    year = "current_year",
+    chunk_days = 1,
+    spinup_days = 7,
+    config = None
+    ):
+    """
+    Simulates the constructive system continuously over a date range of the EPW file
+    instead of a periodic average day. The hourly EPW data is interpolated to the time
+    step ( dt ) and the solar position and sun-air temperature are computed chunk by
+    chunk, so memory does not grow with the length of the simulation.
+
+    Args:
+        constructive_system (list): list of tuples from outside to inside with material and width.
+        epw_file (str): Path to the EPW file.
+        solar_absortance (float): Solar absortance of the system's external material.
+        surface_tilt (float): Surface tilt relative to the ground, 90° == Vertical.
+        surface_azimuth (float): Deviation from true north, 0° == North.
+        start (str, optional): First simulated instant (local standard time). Defaults to
+            the first hour of the EPW file.
+        end (str, optional): End of the simulation, not included. Defaults to one year after start.
+        year (str, optional): Year given to the EPW data. Defaults to current year.
+        chunk_days (float, optional): Days of each yielded DataFrame. Defaults to 1.
+        spinup_days (float, optional): Days simulated before start and discarded, so the
+            result does not depend on the initial temperatures. The EPW year is taken as
+            periodic, so the days before its first hour come from its end. Defaults to 7.
+        config (SimulationConfig, optional): Simulation configuration. Defaults to the module values.
+
+    Yields:
+        DataFrame: Ambient temperature ( Ta ), solar irradiance on the surface ( Is ), sun-air
+        temperature ( Tsa ) and interior temperature ( Ti ) every dt seconds.
+    """
+
+    import pvlib
+
+    config = _config(config)
+    La = config.La     # Length of the dummy frame
+    Nx = config.Nx     # Number of elements to discretize
+    ho = config.ho     # Outside convection heat transfer
+    hi = config.hi     # Inside convection heat transfer
+    dt = config.dt     # Time step
+
+    if year == "current_year": year = datetime.now().year
+    epw, latitud, longitud, altitud, timezone = readEPW(epw_file,year,alias=True,warns=False,cache=config.cache)
+    timezone=pytz.timezone('Etc/GMT'+f'{(-timezone):+}')
+    location = pvlib.location.Location(latitude=latitud, longitude=longitud, altitude=altitud, tz=timezone)
+
+    start = epw.index[0] if start is None else pd.Timestamp(start)
+    end = start + pd.DateOffset(years=1) if end is None else pd.Timestamp(end)
+    paso = pd.Timedelta(seconds=dt)
+    pasos_bloque = max(1, int(round(chunk_days*86400/dt)))
+
+    k, rhoc, dx = construction_profile(config.properties(), constructive_system, Nx, config.mesh)
+    nx = len(k)
+
+    def bloques(inicio, fin):
+        # Tiempos locales sin zona horaria de cada bloque, sin crear todo el periodo
+        total = int(np.ceil((fin - inicio)/paso))
+        for i in range(0, total, pasos_bloque):
+            yield pd.date_range(inicio + i*paso, periods=min(pasos_bloque, total - i), freq=paso)
+
+    def simular(tiempos, T, Ti):
+        clima = interpolate_EPW(epw, tiempos)
+        posiciones = solar_position(location, tiempos.tz_localize(timezone))
+        dia = pd.DataFrame({'Ta': clima['To'], 'Ig': clima['Ig'], 'Ib': clima['Ib'], 'Id': clima['Id'],
+                            'zenith': posiciones['zenith'].to_numpy(),
+                            'azimuth': posiciones['azimuth'].to_numpy()},
+                           index=tiempos.tz_localize(timezone))
+        Is, Tsa = Tsa_grid(dia, solar_absortance, surface_tilt, surface_azimuth, config=config)
+        Tsa = np.ascontiguousarray(Tsa[0, 0])
+        T, Ti_pasos = solve_transient(Tsa, k, rhoc, dx, nx, T, Ti, ho, hi, La, dt)
+        return dia[['Ta']].assign(Is=Is[0], Tsa=Tsa, Ti=Ti_pasos), T
+
+    inicio = start - pd.Timedelta(days=spinup_days)
+    Ta_inicial = interpolate_EPW(epw, pd.date_range(inicio, periods=24, freq='1h'), ('To',))['To'].mean()
+    T = np.full(nx, Ta_inicial)
+    Ti = Ta_inicial
+
+    for tiempos in bloques(inicio, start):
+        resultados, T = simular(tiempos, T, Ti)
+        Ti = resultados.Ti.iloc[-1]
+
+    for tiempos in bloques(start, end):
+        resultados, T = simular(tiempos, T, Ti)
+        Ti = resultados.Ti.iloc[-1]
+        yield resultados
+
+def mesh_convergence(
+    constructive_system:list,
+    Tsa_dataframe:pd.DataFrame,
+    method = "direct",
+    config = None
+    ) -> float:
+    """
+    Estimates the discretization error of solveCS by solving again on a mesh with every
+    cell split in two (twice Nx, or LayerMesh.refined() when config.mesh is set). The
+    scheme converges to first order with the cell size, so the error of the given mesh is
+    about twice the difference between both solutions.
+
+    Args:
+        constructive_system (list): list of tuples from outside to inside with material and width.
+        Tsa_dataframe (DataFrame): Predicted sun-air temperature ( Tsa ) for the average day DataFrame.
+        method (str, optional): solveCS method. Defaults to "direct", which has no convergence
+            tolerance that could hide the mesh error.
+        config (SimulationConfig, optional): Simulation configuration. Defaults to the module values.
+
+    Returns:
+        float: Estimated largest error of the interior temperature ( Ti ) in °C.
+    """
+    config = _config(config)
+    if config.mesh is None:
+        refinada = dataclasses.replace(config, Nx=2*config.Nx)
     else:
-        while C > 5e-4: 
-            Told = T.copy()
-            for tiempo, datos in SC_dataframe.iterrows():
-                a,b,c,d = calculate_coefficients(dt, dx, k, Nx, rhoc, T, datos["Tsa"], ho, datos["Ti"], hi)
-                T, Ti = solve_PQ(a, b, c, d, T, Nx, datos['Ti'], hi, La, dt)
-                SC_dataframe.loc[tiempo,"Ti"] = Ti
-            Tnew = T.copy()
-            C = abs(Told - Tnew).mean()
-        #    FD   = (SC_dataframe.Ti.max() - SC_dataframe.Ti.min())/(SC_dataframe.Ta.max()-SC_dataframe.Ta.min())
-        #    FDsa = (SC_dataframe.Ti.max() - SC_dataframe.Ti.min())/(SC_dataframe.Tsa.max()-SC_dataframe.Tsa.min())
-
-        resultados = SC_dataframe['Ti']
+        refinada = dataclasses.replace(config, mesh=config.mesh.refined())
+
+    Ti = solveCS(constructive_system, Tsa_dataframe, method=method, config=config)
+    Ti_refinada = solveCS(constructive_system, Tsa_dataframe, method=method, config=refinada)
+
+    return 2*float(np.abs(Ti.to_numpy() - Ti_refinada.to_numpy()).max())
+
+def solveCS_batch(
+    constructive_systems:list,
+    Tsa_dataframes,
+    method = "iterative",
+    config = None,
+    AC = False,
+    setpoint = None
+    )->np.ndarray:
+    """
+    Solves the inside temperature of many constructive systems in a single call.
+    The systems are solved in parallel and the materials file is read only once.
+    The threading layer is Numba's choice, see NUMBA_THREADING_LAYER_PRIORITY.
+
+    Args:
+        constructive_systems (list): list of constructive systems, each one a list of tuples
+            from outside to inside with material and width.
+        Tsa_dataframes (DataFrame or list): Tsa DataFrame shared by all the systems, or a list
+            with one Tsa DataFrame per system. All of them must span the same time steps.
+        method (str, optional): "iterative" or "direct", as in solveCS. Defaults to "iterative".
+        config (SimulationConfig, optional): Simulation configuration. Defaults to the module values.
+        AC (bool, optional): Air conditioning as in solveCS, with the "iterative" method. Defaults to False.
+        setpoint (float or tuple, optional): Air conditioning setpoint as in solveCS. Defaults to
+            the Tn ± DeltaTn band of each Tsa DataFrame.
+
+    Returns:
+        ndarray: Interior temperature ( Ti ) with shape (systems, time steps). With AC, a tuple
+        (Ti, Qin, Qac, cooling, heating) with the heat fluxes in W/m² with the same shape as Ti
+        and the daily cooling and heating energies of each system in Wh/m².
+    """
     
+    config = _config(config)
+    La = config.La     # Length of the dummy frame
+    Nx = config.Nx     # Number of elements to discretize
+    ho = config.ho     # Outside convection heat transfer
+    hi = config.hi     # Inside convection heat transfer
+    dt = config.dt     # Time step
+
+    n = len(constructive_systems)
+    if isinstance(Tsa_dataframes, pd.DataFrame):
+        Tsa_dataframes = [Tsa_dataframes]
+    if len(Tsa_dataframes) not in (1, n):
+        raise ValueError("Tsa_dataframes must contain one DataFrame or one per constructive system")
+
+    if AC and method != "iterative":
+        raise ValueError("AC is only available with the 'iterative' method")
+
+    SC_dataframes = [sample_dataframe(df, dt) for df in Tsa_dataframes]
+    Tsa_arrays = np.array([df['Tsa'].to_numpy(dtype=np.float64) for df in SC_dataframes])
+    Tn_means = np.array([df.Tn.mean() for df in Tsa_dataframes])
+    if AC:
+        Tmin, Tmax = (np.array(limites) for limites in zip(*(comfort_band(df, setpoint) for df in SC_dataframes)))
+    if len(Tsa_dataframes) == 1:
+        Tsa_arrays = np.repeat(Tsa_arrays, n, axis=0)
+        Tn_means = np.repeat(Tn_means, n)
+        if AC:
+            Tmin, Tmax = np.repeat(Tmin, n, axis=0), np.repeat(Tmax, n, axis=0)
+
+    propiedades = config.properties()
+
+    k, rhoc, dx, nodos = stack_profiles(propiedades, constructive_systems, Nx, config.mesh)
+
+    T = np.repeat(Tn_means[:, None], k.shape[1], axis=1)
+    Ti = np.repeat(Tn_means[:, None], Tsa_arrays.shape[1], axis=1)
+
+    if AC:
+        T, Ti, Qin, Qac, cooling, heating = solve_periodic_AC_batch(Tsa_arrays, k, rhoc, dx, nodos, T, Ti,
+                                                                    Tmin, Tmax, ho, hi, La, dt)
+        return Ti, Qin, Qac, cooling, heating
+    elif method == "iterative":
+        T, Ti = solve_periodic_batch(Tsa_arrays, k, rhoc, dx, nodos, T, Ti, ho, hi, La, dt)
+    elif method == "direct":
+        T, Ti = solve_periodic_direct_batch(Tsa_arrays, k, rhoc, dx, nodos, T, Ti, ho, La, dt)
+    else:
+        raise ValueError(f"Unknown method {method!r}, use 'iterative' or 'direct'")
+
+    return Ti
+
+def solveRoom(
+    surfaces,
+    config = None
+    )->pd.DataFrame:
+    """
+    Solves the interior temperature of a room enclosed by several surfaces, for example
+    four walls and a roof, each one with its own constructive system and sun-air temperature.
+    All the surfaces are advanced together in a single compiled loop and share the interior
+    air, whose temperature follows the area-weighted mean of their inside surface
+    temperatures. The room is La deep over the total area, so a single surface gives the
+    solveCS result.
+
+    Args:
+        surfaces (dict or list): Surfaces of the room, each one a tuple with its constructive
+            system (list of tuples from outside to inside with material and width), its Tsa
+            DataFrame and its area in m². A dict names the surfaces; a list names them by position.
+            All the Tsa DataFrames must span the same time steps.
+        config (SimulationConfig, optional): Simulation configuration. Defaults to the module values.
+
+    Returns:
+        DataFrame: Interior temperature ( Ti ) and the heat flux from each surface into the room
+        in W/m² ( Qin_<name> ). The mean change of the temperature profiles over the last simulated
+        day is stored in attrs["residual"] and the number of simulated days in attrs["iterations"].
+    """
+
+    config = _config(config)
+    La = config.La     # Length of the dummy frame
+    Nx = config.Nx     # Number of elements to discretize
+    ho = config.ho     # Outside convection heat transfer
+    hi = config.hi     # Inside convection heat transfer
+    dt = config.dt     # Time step
+
+    if not isinstance(surfaces, dict):
+        surfaces = dict(enumerate(surfaces))
+    if not surfaces:
+        raise ValueError("surfaces must contain at least one surface")
+    constructive_systems, Tsa_dataframes, areas = zip(*surfaces.values())
+
+    SC_dataframes = [sample_dataframe(df, dt) for df in Tsa_dataframes]
+    if len({len(df) for df in SC_dataframes}) > 1:
+        raise ValueError("All the Tsa DataFrames must span the same time steps")
+    Tsa_arrays = np.array([df['Tsa'].to_numpy(dtype=np.float64) for df in SC_dataframes])
+    area = np.array(areas, dtype=np.float64)
+    if np.any(area <= 0):
+        raise ValueError("The areas of the surfaces must be positive")
+
+    propiedades = config.properties()
+    k, rhoc, dx, nodos = stack_profiles(propiedades, list(constructive_systems), Nx, config.mesh)
+
+    Tn = np.mean([df.Tn.mean() for df in Tsa_dataframes])
+    T = np.full(k.shape, Tn)
+    Ti = np.full(Tsa_arrays.shape[1], Tn)
+
+    T, Ti, Ts, residual, historia = solve_room_periodic(Tsa_arrays, k, rhoc, dx, nodos, area, T, Ti, ho, hi, La, dt)
+
+    resultados = pd.DataFrame({'Ti': Ti}, index=SC_dataframes[0].index)
+    for nombre, Tsup in zip(surfaces, Ts):
+        resultados[f'Qin_{nombre}'] = hi*(Tsup - Ti)
+    resultados.attrs['residual'] = residual
+    resultados.attrs['iterations'] = len(historia)
+
     return resultados
+
+def solveCS_harmonic(
+    constructive_system:list,
+    Tsa_dataframe:pd.DataFrame,
+    config = None
+    )->pd.Series:
+    """
+    Solves the constructive system's inside temperature in the frequency domain. The
+    periodic Tsa signal is decomposed with an FFT and every harmonic goes through the
+    analytic transfer matrix of the layers, so each wall costs a few small complex
+    products instead of a time-stepping simulation. It reaches the same periodic state
+    as solveCS, which converges to it as dt decreases; use solveCS to validate the results.
+
+    Args:
+        constructive_system (list): list of tuples from outside to inside with material and width.
+        Tsa_dataframe (DataFrame): Predicted sun-air temperature ( Tsa ) per second for the average day DataFrame.
+        config (SimulationConfig, optional): Simulation configuration. Defaults to the module values.
+
+    Returns:
+        Series: Interior temperature ( Ti ) for the constructive system at the solveCS time steps.
+    """
+    
+    config = _config(config)
+    ho = config.ho     # Outside convection heat transfer
+    hi = config.hi     # Inside convection heat transfer
+    dt = config.dt     # Time step
+
+    propiedades = config.properties()
+    cs = set_construction(propiedades, constructive_system)
+
+    SC_dataframe = sample_dataframe(Tsa_dataframe, dt)
+    Tsa_array = SC_dataframe['Tsa'].to_numpy(dtype=np.float64)
+
+    Ti = harmonic_response(Tsa_array, cs, ho, hi, dt)
+
+    return pd.Series(Ti, index=SC_dataframe.index, name='Ti')
+
+from .scenarios import run_scenarios
+
+def __getattr__(name):
+    # climate_index is imported on first use so `python -m enerhabitat.climate_index` runs it only once
+    if name in ("ClimateIndex", "build_climate_index"):
+        from . import climate_index
+        return getattr(climate_index, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
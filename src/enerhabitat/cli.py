@@ -0,0 +1,204 @@
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import dataclasses
+import argparse
+import itertools
+import numpy as np
+
+import enerhabitat as eh
+
+"""
+=============================
+      Command line tool
+=============================
+"""
+
+_MANIFIESTO = "scenarios.json"
+_CONFIG = ("La", "Nx", "ho", "hi", "dt")
+
+def load_scenario_file(scenario_file):
+    """
+    Reads a scenario file and expands it into the scenarios of run_scenarios.
+
+    The file is a JSON object with the lists "epw" (EPW paths), "months", "orientations"
+    ([surface_tilt, surface_azimuth] pairs), "absortances" and "systems" (name -> list of
+    [material, width] layers), and optionally "materials" (materials INI file), "day", "year"
+    and "config" (La, Nx, ho, hi, dt and mesh, as in SimulationConfig). Paths are relative
+    to the scenario file. Every combination of the lists is a scenario.
+
+    Args:
+        scenario_file (str): Path to the JSON scenario file.
+
+    Returns:
+        tuple: (definition, scenarios, config) the parsed file, the scenario tuples in a
+        fixed order and the SimulationConfig.
+    """
+    with open(scenario_file) as f:
+        definicion = json.load(f)
+    base = os.path.dirname(os.path.abspath(scenario_file))
+    ruta = lambda archivo: os.path.normpath(os.path.join(base, archivo))
+
+    faltantes = [campo for campo in ("epw", "months", "orientations", "absortances", "systems")
+                 if not definicion.get(campo)]
+    if faltantes:
+        raise ValueError(f"{scenario_file} needs non-empty {', '.join(faltantes)}")
+
+    opciones = dict(definicion.get("config", {}))
+    desconocidas = set(opciones) - set(_CONFIG) - {"mesh"}
+    if desconocidas:
+        raise ValueError(f"Unknown config values {sorted(desconocidas)}, use {', '.join(_CONFIG)} or mesh")
+    if "mesh" in opciones:
+        opciones["mesh"] = eh.LayerMesh(**opciones["mesh"])
+    if "materials" in definicion:
+        opciones["materials"] = eh.Materials(ruta(definicion["materials"]))
+    config = dataclasses.replace(eh._config(None), **opciones)
+
+    sistemas = definicion["systems"]
+    scenarios = [(ruta(epw_file), int(month), (float(tilt), float(azimuth)), float(absortance), sistemas[nombre])
+                 for epw_file, month, (tilt, azimuth), absortance, nombre in itertools.product(
+                     definicion["epw"], definicion["months"], definicion["orientations"],
+                     definicion["absortances"], sistemas)]
+    return definicion, scenarios, config
+
+def _completed(output):
+    # Posiciones de los escenarios guardados en los fragmentos existentes
+    hechos = set()
+    for fragmento in glob.glob(os.path.join(output, "shard-*.npz")):
+        with np.load(fragmento) as datos:
+            hechos.update(datos['index'].tolist())
+    return hechos
+
+def _write_shard(output, numero, columnas):
+    # Escritura atómica: un fragmento existe completo o no existe
+    ruta = os.path.join(output, f"shard-{numero:05d}.npz")
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'wb') as f:
+        np.savez(f, **{nombre: np.asarray(valores) for nombre, valores in columnas.items()})
+    os.replace(temporal, ruta)
+    return ruta
+
+def run(scenario_file, output, workers=None, shard_size=1000, config=None):
+    """
+    Runs the scenarios of a scenario file and stores the results in npz shards of output as
+    they complete. Scenarios already stored in output are skipped, so an interrupted run
+    resumes where it stopped.
+
+    Every shard has the columns "index" (position of the scenario), "epw", "month" and
+    "system" (positions in the lists of the scenario file), "tilt", "azimuth", "absortance"
+    and "Ti" (interior temperature at the solver time steps, one row per scenario).
+
+    Args:
+        scenario_file (str): Path to the JSON scenario file, see load_scenario_file.
+        output (str): Output directory.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        shard_size (int, optional): Scenarios per shard. Defaults to 1000.
+        config (SimulationConfig, optional): Overrides the configuration of the scenario file.
+
+    Returns:
+        int: Number of scenarios run.
+    """
+    definicion, scenarios, config_archivo = load_scenario_file(scenario_file)
+    config = config_archivo if config is None else config
+    os.makedirs(output, exist_ok=True)
+
+    # El manifiesto evita mezclar resultados de otros escenarios en el mismo directorio
+    texto = json.dumps(definicion, sort_keys=True)
+    huella = hashlib.blake2b(texto.encode(), digest_size=16).hexdigest()
+    manifiesto = os.path.join(output, _MANIFIESTO)
+    if os.path.isfile(manifiesto):
+        with open(manifiesto) as f:
+            if json.load(f).get("hash") != huella:
+                raise ValueError(f"{output} holds the results of other scenarios")
+    else:
+        with open(manifiesto, "w") as f:
+            json.dump({"hash": huella, "definition": definicion, "count": len(scenarios)}, f, indent=2)
+
+    hechos = _completed(output)
+    pendientes = [i for i in range(len(scenarios)) if i not in hechos]
+    if not pendientes:
+        return 0
+
+    epws = {epw_file: n for n, epw_file in enumerate(definicion["epw"])}
+    nombres = {nombre: n for n, nombre in enumerate(definicion["systems"])}
+    combinaciones = list(itertools.product(definicion["epw"], definicion["months"], definicion["orientations"],
+                                           definicion["absortances"], definicion["systems"]))
+    numero = max([int(os.path.basename(f)[6:11]) + 1 for f in glob.glob(os.path.join(output, "shard-*.npz"))],
+                 default=0)
+
+    columnas = {nombre: [] for nombre in ("index", "epw", "month", "system", "tilt", "azimuth", "absortance", "Ti")}
+    corridos = 0
+    inicio = time.perf_counter()
+    resultados = eh.run_scenarios([scenarios[i] for i in pendientes], workers=workers,
+                                  day=definicion.get("day", "15"), year=definicion.get("year", "current_year"),
+                                  config=config)
+    for n, Ti in resultados:
+        i = pendientes[n]
+        epw_file, month, (tilt, azimuth), absortance, nombre = combinaciones[i]
+        for columna, valor in zip(columnas, (i, epws[epw_file], month, nombres[nombre],
+                                             tilt, azimuth, absortance, Ti)):
+            columnas[columna].append(valor)
+        corridos += 1
+        if len(columnas["index"]) == shard_size or corridos == len(pendientes):
+            _write_shard(output, numero, columnas)
+            numero += 1
+            columnas = {nombre: [] for nombre in columnas}
+            print(f"{len(hechos) + corridos}/{len(scenarios)} scenarios "
+                  f"({time.perf_counter() - inicio:.1f} s)", file=sys.stderr)
+    return corridos
+
+def load_results(output):
+    """
+    Loads all the shards of an output directory, sorted by scenario position.
+
+    Args:
+        output (str): Output directory of run.
+
+    Returns:
+        dict: Columns of the shards as arrays.
+    """
+    fragmentos = []
+    for ruta in sorted(glob.glob(os.path.join(output, "shard-*.npz"))):
+        with np.load(ruta) as datos:
+            fragmentos.append({columna: datos[columna] for columna in datos.files})
+    if not fragmentos:
+        return {}
+    columnas = {columna: np.concatenate([f[columna] for f in fragmentos]) for columna in fragmentos[0]}
+    orden = np.argsort(columnas["index"], kind="stable")
+    return {columna: valores[orden] for columna, valores in columnas.items()}
+
+def main(argv=None):
+    """
+    Entry point of the enerhabitat command.
+
+        enerhabitat run SCENARIO_FILE --output DIRECTORY [--workers N] [--shard-size N]
+        enerhabitat index build DIRECTORY | query INDEX --latitude MIN MAX
+    """
+    parser = argparse.ArgumentParser(prog="enerhabitat", description="Thermal performance of constructive systems")
+    comandos = parser.add_subparsers(dest="command", required=True)
+    correr = comandos.add_parser("run", help="run the scenarios of a JSON scenario file")
+    correr.add_argument("scenario_file", help="JSON scenario file")
+    correr.add_argument("-o", "--output", required=True, help="output directory for the npz shards")
+    correr.add_argument("--workers", type=int, help="worker processes (default all the CPUs)")
+    correr.add_argument("--shard-size", type=int, default=1000, help="scenarios per shard (default 1000)")
+    indice = comandos.add_parser("index", help="build or query a climate index, see python -m enerhabitat.climate_index")
+    indice.add_argument("arguments", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    if args.command == "index":
+        from .climate_index import main as index_main
+        return index_main(args.arguments)
+
+    try:
+        corridos = run(args.scenario_file, args.output, args.workers, args.shard_size)
+    except (OSError, ValueError, KeyError) as error:
+        print(f"enerhabitat: {error}", file=sys.stderr)
+        return 1
+    print(f"{corridos} scenarios run, results in {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+import concurrent.futures as cf
+
+import enerhabitat as eh
+
+"""
+=============================
+        Climate index
+=============================
+"""
+
+_INDEX_VERSION = 1
+_MESES = np.arange(1, 13)
+_HORAS = np.arange(24)
+
+def summarize_EPW(file):
+    """
+    Monthly summaries of an EPW file, everything meanDay needs from it.
+
+    Args:
+        file (str): Path to the EPW file.
+
+    Returns:
+        dict: Site name, latitude, longitude, altitude and timezone from the header, tTmax, Tmin
+        and Tmax of each month (12 values) and the hourly means of Ig, Ib and Id of each month
+        (12 x 24 values).
+    """
+    with open(file, encoding="latin-1") as epw_file:
+        nombre = epw_file.readline().split(',')[1].strip()
+    epw, latitud, longitud, altitud, timezone = eh.readEPW(file, alias=True, warns=False, cache=False)
+
+    temperaturas = eh.calculate_tTmaxTminTmax_months(epw).reindex(_MESES)
+    irradiancias = eh.hourly_irradiance_months(epw).reindex(pd.MultiIndex.from_product([_MESES, _HORAS]))
+    resumen = {"name": nombre, "latitude": latitud, "longitude": longitud,
+               "altitude": altitud, "timezone": timezone}
+    for columna in ['tTmax', 'Tmin', 'Tmax']:
+        resumen[columna] = temperaturas[columna].to_numpy(dtype=np.float64)
+    for columna in ['Ig', 'Ib', 'Id']:
+        resumen[columna] = irradiancias[columna].to_numpy(dtype=np.float64).reshape(12, 24)
+    return resumen
+
+def _scan(directory):
+    # Rutas relativas de los EPW del directorio y sus subdirectorios, en orden estable
+    rutas = []
+    for raiz, _, archivos in os.walk(directory):
+        for archivo in archivos:
+            if archivo.lower().endswith('.epw'):
+                rutas.append(os.path.relpath(os.path.join(raiz, archivo), directory))
+    return sorted(rutas)
+
+def build_climate_index(
+    directory:str,
+    index_file = None,
+    workers = None
+    ):
+    """
+    Scans a directory of EPW files (including subdirectories) and stores the monthly summaries
+    of every file in a single npz index. Files already in an existing index with the same
+    modification time and size are not parsed again, and removed files are dropped.
+
+    Args:
+        directory (str): Directory with the EPW files.
+        index_file (str, optional): Path of the index. Defaults to climate_index.npz in directory.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs,
+            1 parses everything in the current process.
+
+    Returns:
+        ClimateIndex: The updated index.
+    """
+    index_file = os.path.join(directory, "climate_index.npz") if index_file is None else index_file
+    workers = os.cpu_count() if workers is None else workers
+
+    anterior = {}
+    if os.path.isfile(index_file):
+        viejo = ClimateIndex(index_file)
+        if viejo.directory == os.path.abspath(directory):
+            anterior = {ruta: i for i, ruta in enumerate(viejo._datos['path'])}
+
+    rutas = _scan(directory)
+    firmas = {}
+    for ruta in rutas:
+        estado = os.stat(os.path.join(directory, ruta))
+        firmas[ruta] = (estado.st_mtime_ns, estado.st_size)
+
+    # Se conservan los resúmenes de los archivos sin cambios
+    resumenes = {}
+    for ruta in rutas:
+        i = anterior.get(ruta)
+        if i is not None and (viejo._datos['mtime'][i], viejo._datos['size'][i]) == firmas[ruta]:
+            resumenes[ruta] = viejo._summary(i)
+    faltantes = [ruta for ruta in rutas if ruta not in resumenes]
+    archivos = [os.path.join(directory, ruta) for ruta in faltantes]
+    if workers > 1 and len(faltantes) > 1:
+        with cf.ProcessPoolExecutor(max_workers=workers) as pool:
+            resumenes.update(zip(faltantes, pool.map(summarize_EPW, archivos, chunksize=8)))
+    else:
+        resumenes.update(zip(faltantes, map(summarize_EPW, archivos)))
+
+    # Sitios ordenados por latitud para las consultas por bandas
+    rutas = sorted(rutas, key=lambda ruta: (resumenes[ruta]['latitude'], ruta))
+    datos = {'version': np.array(_INDEX_VERSION),
+             'directory': np.array(os.path.abspath(directory)),
+             'path': np.array(rutas, dtype=str),
+             'mtime': np.array([firmas[ruta][0] for ruta in rutas], dtype=np.int64),
+             'size': np.array([firmas[ruta][1] for ruta in rutas], dtype=np.int64)}
+    for campo, tipo in [('name', str), ('latitude', np.float64), ('longitude', np.float64),
+                        ('altitude', np.float64), ('timezone', np.int64)]:
+        datos[campo] = np.array([resumenes[ruta][campo] for ruta in rutas], dtype=tipo)
+    for campo, forma in [('tTmax', (12,)), ('Tmin', (12,)), ('Tmax', (12,)),
+                         ('Ig', (12, 24)), ('Ib', (12, 24)), ('Id', (12, 24))]:
+        datos[campo] = np.array([resumenes[ruta][campo] for ruta in rutas],
+                                dtype=np.float64).reshape((len(rutas),) + forma)
+
+    temporal = f"{index_file}.{os.getpid()}.tmp"
+    with open(temporal, 'wb') as f:
+        np.savez(f, **datos)
+    os.replace(temporal, index_file)
+    return ClimateIndex(index_file)
+
+class ClimateIndex:
+    """
+    Monthly climate summaries of a directory of EPW files, built with build_climate_index.
+    The average days are computed from the summaries without reading the EPW files.
+
+    Args:
+        index_file (str): Path of the npz index.
+    """
+    def __init__(self, index_file):
+        with np.load(index_file, allow_pickle=False) as datos:
+            self._datos = {campo: datos[campo] for campo in datos.files}
+        if int(self._datos['version']) != _INDEX_VERSION:
+            raise ValueError(f"{index_file} was built by another version, build it again")
+        self.directory = str(self._datos['directory'])
+        self._posiciones = {ruta: i for i, ruta in enumerate(self._datos['path'])}
+
+    def __len__(self):
+        return len(self._datos['path'])
+
+    def sites(self):
+        """
+        Returns:
+            DataFrame: Path (relative to the indexed directory), name, latitude, longitude,
+            altitude and timezone of every site, sorted by latitude.
+        """
+        return pd.DataFrame({campo: self._datos[campo] for campo in
+                             ['path', 'name', 'latitude', 'longitude', 'altitude', 'timezone']})
+
+    def query(self, latitude=(-90, 90), longitude=(-180, 180)):
+        """
+        Sites within a latitude band and, optionally, a longitude band.
+
+        Args:
+            latitude (tuple, optional): (minimum, maximum) latitude, both included.
+            longitude (tuple, optional): (minimum, maximum) longitude, both included.
+
+        Returns:
+            DataFrame: The sites as in sites().
+        """
+        latitudes = self._datos['latitude']
+        inicio = np.searchsorted(latitudes, latitude[0], side='left')
+        fin = np.searchsorted(latitudes, latitude[1], side='right')
+        sitios = self.sites().iloc[inicio:fin]
+        return sitios[sitios.longitude.between(*longitude)]
+
+    def _position(self, site):
+        if isinstance(site, (int, np.integer)):
+            return int(site)
+        ruta = os.path.relpath(os.path.abspath(site), self.directory) if os.path.isabs(site) else site
+        if ruta not in self._posiciones:
+            raise KeyError(f"{site} is not in the climate index")
+        return self._posiciones[ruta]
+
+    def _summary(self, i):
+        resumen = {campo: self._datos[campo][i] for campo in
+                   ['name', 'latitude', 'longitude', 'altitude', 'timezone',
+                    'tTmax', 'Tmin', 'Tmax', 'Ig', 'Ib', 'Id']}
+        resumen['name'] = str(resumen['name'])
+        return resumen
+
+    def meanYear(self, site, months=range(1, 13), day="15", year="current_year", resolution=1):
+        """
+        Average days of a site computed from the index, equal to meanYear on its EPW file.
+
+        Args:
+            site (str or int): Path of the EPW file (relative to the indexed directory or
+                absolute) or position in sites().
+            months (list, optional): Months of interest. Defaults to all the months.
+            day (str, optional): Day of interest. Defaults to 15.
+            year (str, optional): Year of interest. Defaults to current year.
+            resolution (int, optional): Time step of the average day in seconds. Defaults to 1.
+
+        Returns:
+            dict: meanDay DataFrame of each month, keyed by month number.
+        """
+        if year == "current_year": year = pd.Timestamp.now().year
+        resumen = self._summary(self._position(site))
+        temperaturas = pd.DataFrame({columna: resumen[columna] for columna in ['tTmax', 'Tmin', 'Tmax']},
+                                    index=_MESES)
+        irradiancias = pd.DataFrame({columna: resumen[columna].ravel() for columna in ['Ig', 'Id', 'Ib']},
+                                    index=pd.MultiIndex.from_product([_MESES, _HORAS]))
+        tiempos = dict.fromkeys(["solar_position", "temperature_model", "irradiance"], 0.0)
+        return eh._average_days(float(resumen['latitude']), float(resumen['longitude']),
+                                float(resumen['altitude']), int(resumen['timezone']),
+                                temperaturas, irradiancias, [int(month) for month in months],
+                                day, year, resolution, tiempos)
+
+    def meanDay(self, site, day="15", month="current_month", year="current_year", resolution=1):
+        """
+        Average day of a site computed from the index, equal to meanDay on its EPW file.
+
+        Args:
+            site (str or int): Path of the EPW file or position in sites(), see meanYear.
+            day (str, optional): Day of interest. Defaults to 15.
+            month (str, optional): Month of interest. Defaults to current month.
+            year (str, optional): Year of interest. Defaults to current year.
+            resolution (int, optional): Time step of the average day in seconds. Defaults to 1.
+
+        Returns:
+            DataFrame: meanDay DataFrame.
+        """
+        if month == "current_month": month = pd.Timestamp.now().month
+        return self.meanYear(site, [month], day, year, resolution)[int(month)]
+
+def main(argv=None):
+    """
+    Builds or queries a climate index from the command line.
+
+        python -m enerhabitat.climate_index build DIRECTORY [--index FILE] [--workers N]
+        python -m enerhabitat.climate_index query FILE --latitude MIN MAX [--longitude MIN MAX]
+    """
+    parser = argparse.ArgumentParser(prog="python -m enerhabitat.climate_index",
+                                     description="Monthly climate summaries of a directory of EPW files")
+    comandos = parser.add_subparsers(dest="command", required=True)
+    construir = comandos.add_parser("build", help="scan a directory and build or update its index")
+    construir.add_argument("directory", help="directory with the EPW files")
+    construir.add_argument("--index", help="index file (default DIRECTORY/climate_index.npz)")
+    construir.add_argument("--workers", type=int, help="worker processes (default all the CPUs)")
+    consultar = comandos.add_parser("query", help="list the sites within a latitude band")
+    consultar.add_argument("index", help="index file")
+    consultar.add_argument("--latitude", type=float, nargs=2, default=(-90, 90), metavar=("MIN", "MAX"))
+    consultar.add_argument("--longitude", type=float, nargs=2, default=(-180, 180), metavar=("MIN", "MAX"))
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        indice = build_climate_index(args.directory, args.index, args.workers)
+        print(f"{len(indice)} sites indexed")
+    else:
+        sitios = ClimateIndex(args.index).query(tuple(args.latitude), tuple(args.longitude))
+        print(sitios.to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,8 +3,16 @@ import numpy as np
 import configparser
 import warnings
 import os
+import io
 import math
-from numba import njit
+import hashlib
+import pickle
+import zipfile
+import dataclasses
+import functools
+import threading
+from collections import namedtuple, OrderedDict
+from numba import njit, prange
 from dateutil.parser import parse
 
 """
@@ -44,6 +52,27 @@ def materials(new_config_file=None):
     finally:
         return _eh_config      
 
+_eh_cache = os.environ.get("ENERHABITAT_CACHE",
+                           os.path.join(os.path.expanduser("~"), ".cache", "enerhabitat"))    # Default cache directory
+
+def cache_dir(new_cache_dir=None):
+    """
+    Returns the path to the cache directory. If "new_cache_dir" is defined,
+    it modifies the established path. The default can also be set with the
+    ENERHABITAT_CACHE environment variable.
+
+    Args:
+        new_cache_dir (str, optional): Path of the cache directory to use.
+
+    Returns:
+        str : Path to the active cache directory
+    """
+    global _eh_cache
+
+    if new_cache_dir is not None:
+        _eh_cache = new_cache_dir
+    return _eh_cache
+
 def get_list_materials():
     """
     Returns the list of materials contained in the configuration file
@@ -56,21 +85,51 @@ def get_list_materials():
     materiales = config.sections()
     return materiales
 
-def read_materials():
+class Material:
+    """
+    Thermal properties of a material.
+
+    Args:
+        k (float): Thermal conductivity.
+        rho (float): Density.
+        c (float): Specific heat.
     """
-    returns a dictionary with the list of materials and their properties
+    __slots__ = ("k", "rho", "c")
+
+    def __init__(self, k, rho, c):
+        self.k = k
+        self.rho = rho
+        self.c = c
+
+    def __repr__(self):
+        return f"Material(k={self.k}, rho={self.rho}, c={self.c})"
+
+_materials_cache = {}    # Materiales leídos por ruta: (mtime, tamaño, propiedades)
+
+def read_materials(config_file=None):
+    """
+    returns a dictionary with the list of materials and their properties. Each file
+    is parsed once and read again only when its modification time or size changes.
+
+    Args:
+        config_file (str, optional): Path of the configuration file to read. Defaults to the active one.
 
     Returns:
-        dict: _description_
+        dict: Material of each material name
     """
-    data = configparser.ConfigParser()
-    data.read(materials())
+    ruta = materials() if config_file is None else config_file
+    try:
+        estado = os.stat(ruta)
+        firma = (estado.st_mtime_ns, estado.st_size)
+    except OSError:
+        firma = None
+
+    guardado = _materials_cache.get(os.path.abspath(ruta))
+    if firma is not None and guardado is not None and guardado[0] == firma:
+        return dict(guardado[1])
 
-    class Material:
-        def __init__(self, k, rho, c):
-            self.k = k
-            self.rho = rho
-            self.c = c
+    data = configparser.ConfigParser()
+    data.read(ruta)
 
     materiales = {}
     for material_i in data.sections():
@@ -78,8 +137,328 @@ def read_materials():
         rho = float(data[material_i]['rho'])
         c = float(data[material_i]['c'])
         materiales[material_i] = Material(k, rho, c)
+
+    if firma is not None:
+        _materials_cache[os.path.abspath(ruta)] = (firma, materiales)
     
-    return materiales
+    return dict(materiales)
+
+class Materials:
+    """
+    Materials and properties of a configuration file, read once when created. Use it in a
+    SimulationConfig to run simulations with different materials files at the same time.
+
+    Args:
+        config_file (str, optional): Path of the configuration file. Defaults to the active one.
+    """
+    def __init__(self, config_file=None):
+        self.config_file = materials() if config_file is None else config_file
+        self.properties = read_materials(self.config_file)
+
+    def __getitem__(self, material):
+        return self.properties[material]
+
+    def __contains__(self, material):
+        return material in self.properties
+
+    def names(self):
+        """
+        Returns:
+            list: List of materials in the configuration file
+        """
+        return list(self.properties)
+
+@dataclasses.dataclass(frozen=True)
+class LayerMesh:
+    """
+    Non-uniform mesh with its own cells for every layer of the constructive system, used
+    instead of spreading Nx cells uniformly over the total width. Each layer gets
+    max(min_cells, ceil(L / dx_max)) cells, so thin layers are resolved without refining
+    the whole wall. In the layers touching the outside and inside surfaces the cells grow
+    by the factor grading away from the surface, where the temperature changes fastest.
+
+    Args:
+        min_cells (int): Minimum number of cells of every layer. Defaults to 10.
+        dx_max (float): Mean cell size of a layer in meters. Defaults to 0.005.
+        grading (float): Size ratio of consecutive cells next to the surfaces, 1 for
+            equal cells. Defaults to 1.3.
+        refinement (int): Number of times every cell is split in two, see refined().
+            Defaults to 0.
+    """
+    min_cells: int = 10
+    dx_max: float = 0.005
+    grading: float = 1.3
+    refinement: int = 0
+
+    def __post_init__(self):
+        if self.min_cells < 2:
+            raise ValueError("LayerMesh needs at least 2 cells per layer")
+        if self.dx_max <= 0:
+            raise ValueError("LayerMesh needs a positive dx_max")
+        if self.grading < 1:
+            raise ValueError("LayerMesh needs a grading of at least 1")
+        if self.refinement < 0:
+            raise ValueError("LayerMesh needs a non-negative refinement")
+
+    def refined(self):
+        """
+        Returns:
+            LayerMesh: Mesh with every cell split in two, so every layer has exactly twice
+            as many cells.
+        """
+        return dataclasses.replace(self, refinement=self.refinement + 1)
+
+@dataclasses.dataclass(frozen=True)
+class SimulationConfig:
+    """
+    Simulation parameters passed explicitly to meanDay, Tsa and solveCS. When no
+    configuration is given, the functions use the module values (eh.La, eh.Nx, eh.ho,
+    eh.hi, eh.dt), the active materials file and cache_dir().
+
+    Args:
+        La (float): Length of the dummy frame.
+        Nx (int): Number of elements to discretize.
+        ho (float): Outside convection heat transfer.
+        hi (float): Inside convection heat transfer.
+        dt (int): Time step in seconds.
+        materials (Materials, optional): Materials to use. Defaults to the active materials file.
+        cache (bool or str, optional): True to use cache_dir(), a path to use another cache
+            directory, False to disable the caches. Defaults to True.
+        mesh (LayerMesh, optional): Per-layer mesh used instead of Nx uniform cells. Defaults
+            to None.
+        memoize (bool, optional): Reuse the results of meanDay, meanYear and Tsa computed
+            before for the same inputs, from memory or from the "results" folder of the cache
+            directory (memory only when cache is False). Defaults to False.
+    """
+    La: float = 2.5
+    Nx: int = 200
+    ho: float = 13
+    hi: float = 8.6
+    dt: int = 600
+    materials: Materials = None
+    cache: object = True
+    mesh: LayerMesh = None
+    memoize: bool = False
+
+    def properties(self):
+        """
+        Returns:
+            dict: Materials and their properties for this configuration.
+        """
+        if self.materials is None:
+            return read_materials()
+        return self.materials.properties
+
+def report_diagnostics(diagnostics, timings, **values):
+    """
+    Delivers the diagnostics of a call. Stage timings are merged under "timings", so the
+    same dictionary can be passed to meanDay and solveCS to collect the whole pipeline.
+
+    Args:
+        diagnostics (dict or callable): Dictionary updated in place, or function called with
+            a new dictionary. None disables the diagnostics.
+        timings (dict): Seconds spent in each stage.
+        **values: Other diagnostics of the call.
+    """
+    if diagnostics is None:
+        return
+    if callable(diagnostics):
+        diagnostics(dict(values, timings=dict(timings)))
+    else:
+        diagnostics.setdefault("timings", {}).update(timings)
+        diagnostics.update(values)
+
+"""
+=============================
+      Memoization tools
+=============================
+"""
+_RESULTS_CACHE_VERSION = 2    # Cambia cuando los resultados guardados dejan de ser válidos
+_EPW_hashes = {}    # Huella del contenido de cada EPW leído: (mtime, tamaño, huella)
+
+def EPW_hash(file):
+    """
+    Huella del contenido de un archivo EPW. Se calcula de nuevo solo cuando cambian la
+    fecha de modificación o el tamaño del archivo.
+
+    Args:
+        file (str): Ruta del archivo EPW.
+
+    Returns:
+        str: Huella blake2b del contenido.
+    """
+    estado = os.stat(file)
+    firma = (estado.st_mtime_ns, estado.st_size)
+    guardado = _EPW_hashes.get(os.path.abspath(file))
+    if guardado is not None and guardado[0] == firma:
+        return guardado[1]
+
+    with open(file, 'rb') as epw:
+        huella = hashlib.blake2b(epw.read(), digest_size=16).hexdigest()
+    _EPW_hashes[os.path.abspath(file)] = (firma, huella)
+    return huella
+
+def result_key(*partes):
+    """
+    Llave de un resultado memorizado a partir de sus argumentos. Los arreglos entran con
+    su contenido completo.
+
+    Returns:
+        str: Huella blake2b de las partes.
+    """
+    h = hashlib.blake2b(repr(_RESULTS_CACHE_VERSION).encode(), digest_size=16)
+    for parte in partes:
+        if isinstance(parte, np.ndarray):
+            h.update(np.ascontiguousarray(parte).tobytes())
+        else:
+            h.update(repr(parte).encode())
+        h.update(b'|')
+    return h.hexdigest()
+
+class ResultCache:
+    """
+    Caché de dos niveles para resultados de meanDay y Tsa: un LRU en memoria y archivos
+    pickle en disco, donde se eliminan los menos usados cuando el directorio supera
+    max_bytes. Lleva la cuenta de aciertos y fallos de cada nivel.
+
+    Args:
+        max_items (int): Resultados guardados en memoria.
+        max_bytes (int): Tamaño máximo de los archivos en disco.
+    """
+    def __init__(self, max_items=128, max_bytes=512 * 2**20):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._estadisticas = dict.fromkeys(["memory_hits", "disk_hits", "misses"], 0)
+
+    def get(self, clave, directorio=None):
+        """
+        Returns:
+            object: Resultado guardado con la llave, o None.
+        """
+        with self._lock:
+            if clave in self._memoria:
+                self._memoria.move_to_end(clave)
+                self._estadisticas["memory_hits"] += 1
+                return self._memoria[clave]
+
+        if directorio is not None:
+            ruta = os.path.join(directorio, f"{clave}.pkl")
+            try:
+                with open(ruta, 'rb') as f:
+                    valor = pickle.load(f)
+                os.utime(ruta)
+            except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+                pass
+            else:
+                with self._lock:
+                    self._estadisticas["disk_hits"] += 1
+                self._guardar_en_memoria(clave, valor)
+                return valor
+
+        with self._lock:
+            self._estadisticas["misses"] += 1
+        return None
+
+    def put(self, clave, valor, directorio=None):
+        """
+        Guarda un resultado en memoria y, si se da un directorio, en disco de forma
+        atómica. Los errores de escritura se ignoran.
+        """
+        self._guardar_en_memoria(clave, valor)
+        if directorio is None:
+            return
+        try:
+            os.makedirs(directorio, exist_ok=True)
+            ruta = os.path.join(directorio, f"{clave}.pkl")
+            temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporal, 'wb') as f:
+                pickle.dump(valor, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporal, ruta)
+            self._desalojar(directorio)
+        except OSError:
+            pass
+
+    def _guardar_en_memoria(self, clave, valor):
+        with self._lock:
+            self._memoria[clave] = valor
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self.max_items:
+                self._memoria.popitem(last=False)
+
+    def _desalojar(self, directorio):
+        # Elimina los archivos usados hace más tiempo hasta quedar bajo max_bytes
+        archivos = []
+        for entrada in os.scandir(directorio):
+            if entrada.name.endswith('.pkl'):
+                estado = entrada.stat()
+                archivos.append((estado.st_mtime_ns, estado.st_size, entrada.path))
+        total = sum(tamaño for _, tamaño, _ in archivos)
+        for _, tamaño, ruta in sorted(archivos):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+            total -= tamaño
+
+    def info(self):
+        """
+        Returns:
+            dict: Aciertos en memoria y en disco, fallos y resultados en memoria.
+        """
+        with self._lock:
+            return dict(self._estadisticas, memory_items=len(self._memoria))
+
+    def clear(self, directorio=None):
+        """
+        Vacía la memoria, reinicia las estadísticas y, si se da un directorio, borra sus archivos.
+        """
+        with self._lock:
+            self._memoria.clear()
+            self._estadisticas = dict.fromkeys(self._estadisticas, 0)
+        if directorio is not None and os.path.isdir(directorio):
+            for entrada in os.scandir(directorio):
+                if entrada.name.endswith('.pkl'):
+                    try:
+                        os.remove(entrada.path)
+                    except OSError:
+                        pass
+
+_results_cache = ResultCache()
+
+def results_dir(cache=True):
+    """
+    Directorio de los resultados memorizados para el valor cache de SimulationConfig.
+
+    Returns:
+        str: Carpeta "results" del directorio de caché, o None si cache es False.
+    """
+    if not cache:
+        return None
+    directorio = cache if isinstance(cache, (str, os.PathLike)) else cache_dir()
+    return os.path.join(directorio, "results")
+
+def cache_info():
+    """
+    Returns the statistics of the memoized meanDay, meanYear and Tsa results.
+
+    Returns:
+        dict: memory_hits, disk_hits, misses and memory_items.
+    """
+    return _results_cache.info()
+
+def cache_clear(cache=True):
+    """
+    Removes the memoized meanDay, meanYear and Tsa results from memory and from disk.
+
+    Args:
+        cache (bool or str, optional): Cache directory as in SimulationConfig, False to only
+            clear the memory. Defaults to cache_dir().
+    """
+    _results_cache.clear(results_dir(cache))
 
 """
 =============================
@@ -105,47 +484,83 @@ def add_temperature_model(df, Tmin, Tmax, Ho, Hi):
     Hi_sec = Hi * 3600
     day_hours = 24 * 3600
     times = pd.to_datetime(df.index)
+    t_sec = (times.hour * 3600 + times.minute * 60 + times.second).to_numpy(dtype=np.float64)
     y = np.zeros(len(times))
-    
-    for i, t in enumerate(times):
-        t_sec = t.hour * 3600 + t.minute * 60 + t.second
-        if t_sec <= Ho_sec:
-            y[i] = (math.cos(math.pi * (Ho_sec - t_sec) / (day_hours + Ho_sec - Hi_sec)) + 1) / 2
-        elif Ho_sec < t_sec <= Hi_sec:
-            y[i] = (math.cos(math.pi * (t_sec - Ho_sec) / (Hi_sec - Ho_sec)) + 1) / 2
-        else:
-            y[i] = (math.cos(math.pi * (day_hours + Ho_sec - t_sec) / (day_hours + Ho_sec - Hi_sec)) + 1) / 2
+
+    # Coseno por tramos: antes del amanecer, hasta la temperatura máxima y después
+    madrugada = t_sec <= Ho_sec
+    manana = (Ho_sec < t_sec) & (t_sec <= Hi_sec)
+    tarde = ~(madrugada | manana)
+    y[madrugada] = (np.cos(np.pi * (Ho_sec - t_sec[madrugada]) / (day_hours + Ho_sec - Hi_sec)) + 1) / 2
+    y[manana] = (np.cos(np.pi * (t_sec[manana] - Ho_sec) / (Hi_sec - Ho_sec)) + 1) / 2
+    y[tarde] = (np.cos(np.pi * (day_hours + Ho_sec - t_sec[tarde]) / (day_hours + Ho_sec - Hi_sec)) + 1) / 2
 
     Ta = Tmin + (Tmax - Tmin) * (1 - y)
     df['Ta'] = Ta
     return df
 
 def calculate_tTmaxTminTmax(mes, epw):
-    epw_mes = epw.loc[epw.index.month==int(mes)]
-    hora_minutos = epw_mes.resample('D').To.idxmax()
-    hora = hora_minutos.dt.hour
-    minuto = hora_minutos.dt.minute
-    tTmax = hora.mean() +  minuto.mean()/60
-    Tmin =  epw_mes.resample('D').To.min().resample('ME').mean().iloc[0]
-    Tmax =  epw_mes.resample('D').To.max().resample('ME').mean().iloc[0]
-    
-    return tTmax,Tmin,Tmax
+    """
+    Calcula tTmax, Tmin y Tmax de un mes del EPW con calculate_tTmaxTminTmax_months.
+
+    Args:
+        mes (int or str): Mes de interés.
+        epw (pd.DataFrame): DataFrame del EPW con la columna To.
+
+    Returns:
+        tuple: (tTmax, Tmin, Tmax) del mes.
+    """
+    tTmax, Tmin, Tmax = calculate_tTmaxTminTmax_months(epw).loc[int(mes)]
+    return tTmax, Tmin, Tmax
+
+def calculate_tTmaxTminTmax_months(epw):
+    """
+    Calcula tTmax, Tmin y Tmax de todos los meses del EPW en una sola agrupación: la hora
+    media del máximo diario y las medias de los mínimos y máximos diarios.
+
+    Args:
+        epw (pd.DataFrame): DataFrame del EPW con la columna To.
+
+    Returns:
+        pd.DataFrame: Columnas tTmax, Tmin y Tmax indexadas por mes.
+    """
+    diario = epw.To.groupby(epw.index.normalize())
+    hora_minutos = pd.DatetimeIndex(diario.idxmax())
+    mes = diario.min().index.month
+    resumen = pd.DataFrame({'hora': hora_minutos.hour,
+                            'minuto': hora_minutos.minute,
+                            'Tmin': diario.min().to_numpy(),
+                            'Tmax': diario.max().to_numpy()}).groupby(mes)
+    tTmax = resumen.hora.mean() + resumen.minuto.mean()/60
 
-def add_IgIbId_Tn(df, epw, mes, f1, f2, timezone):
-    epw_mes = epw.loc[epw.index.month==int(mes)]
-    Irr = epw_mes.groupby(by=epw_mes.index.hour)[['Ig','Id','Ib']].mean()
+    return pd.DataFrame({'tTmax': tTmax, 'Tmin': resumen.Tmin.mean(), 'Tmax': resumen.Tmax.mean()})
+
+def hourly_irradiance_months(epw):
+    """
+    Promedios horarios de Ig, Id e Ib de todos los meses del EPW en una sola agrupación.
+
+    Args:
+        epw (pd.DataFrame): DataFrame del EPW con las columnas Ig, Ib e Id.
+
+    Returns:
+        pd.DataFrame: Promedios indexados por (mes, hora).
+    """
+    return epw.groupby(by=[epw.index.month, epw.index.hour])[['Ig','Id','Ib']].mean()
+
+def add_IgIbId_Tn(df, epw, mes, f1, f2, timezone, Irr=None):
+    if Irr is None:
+        epw_mes = epw.loc[epw.index.month==int(mes)]
+        Irr = epw_mes.groupby(by=epw_mes.index.hour)[['Ig','Id','Ib']].mean()
     tiempo = pd.date_range(start=f1, end=parse(f2), freq='1h',tz=timezone)
-    Irr.index = tiempo
-    Irr = Irr.resample('1s').interpolate(method='time')
-    df['Ig'] = Irr.Ig
-    df['Ib'] = Irr.Ib
-    df['Id'] = Irr.Id
-    df.ffill(inplace=True)
+    # Interpolación lineal en el tiempo de los promedios horarios; después de la
+    # última hora se conserva el último valor
+    for columna in ['Ig', 'Ib', 'Id']:
+        df[columna] = np.interp(df.index.asi8, tiempo.asi8, Irr[columna].to_numpy())
     df['Tn'] = 13.5 + 0.54*df.Ta.mean()
     
     return df
 
-@njit
+@njit(nogil=True, cache=True)
 def calculate_DtaTn(Delta):
     if Delta < 13:
         tmp2 = 2.5 / 2
@@ -174,17 +589,42 @@ def calculate_DtaTn(Delta):
 
 def get_sunrise_sunset_times(df):
     """
-    Función para calcular Ho y Hi
+    Función para calcular Ho y Hi de un DataFrame con la columna elevation. Solo convierte
+    el índice a segundos del día y delega en horas_sol, la única implementación del cruce
+    por cero, que también usa solar_days.
     """
-    sunrise_time = df[df['elevation'] >= 0].index[0]
-    sunset_time = df[df['elevation'] >= 0].index[-1]
-    
-    Ho = sunrise_time.hour + sunrise_time.minute / 60
-    Hi = sunset_time.hour + sunset_time.minute / 60
+    elevacion = df['elevation'].to_numpy(dtype=np.float64)
+    t_sec = (df.index.hour * 3600 + df.index.minute * 60 + df.index.second).to_numpy(dtype=np.float64)
+    return horas_sol(t_sec, elevacion)
+
+def horas_sol(t_sec, elevacion):
+    """
+    Ho y Hi a partir de la elevación solar en los segundos t_sec del día, interpolando
+    linealmente su cruce por cero.
+    """
+    arriba = np.flatnonzero(elevacion >= 0)
+    i, j = arriba[0], arriba[-1]
+
+    # Primer segundo con el sol sobre el horizonte
+    sunrise = t_sec[i]
+    if i > 0:
+        cruce = t_sec[i-1] + (t_sec[i] - t_sec[i-1]) * (0 - elevacion[i-1]) / (elevacion[i] - elevacion[i-1])
+        sunrise = min(math.ceil(cruce), sunrise)
+
+    # Último segundo con el sol sobre el horizonte
+    sunset = t_sec[j]
+    if j < len(elevacion) - 1:
+        cruce = t_sec[j] + (t_sec[j+1] - t_sec[j]) * (0 - elevacion[j]) / (elevacion[j+1] - elevacion[j])
+        sunset = max(math.floor(cruce), sunset)
+
+    Ho = sunrise // 3600 + (sunrise % 3600) // 60 / 60
+    Hi = sunset // 3600 + (sunset % 3600) // 60 / 60
     
     return Ho, Hi
 
-def readEPW(file,year=None,alias=False,warns=True):
+_EPW_CACHE_VERSION = 1    # Incrementar si cambia el formato del caché de EPW
+
+def readEPW(file,year=None,alias=False,warns=True,cache=True):
     """
     Read EPW file 
 
@@ -192,6 +632,11 @@ def readEPW(file,year=None,alias=False,warns=True):
         file : path location of EPW file
         year : None default to leave intact the year or change if desired. It raises a warning.
         alias : False default, True to change to To, Ig, Ib, Ws, RH, ...
+        cache : True default to keep the parsed file in a binary cache inside cache_dir(),
+                keyed on the file contents so it is invalidated when the file changes. Each new
+                EPW file writes an npz file there (~/.cache/enerhabitat unless ENERHABITAT_CACHE
+                is set). A path uses that cache directory instead, False reads the file without
+                touching the disk.
     
     Return:
         tuple: 
@@ -202,14 +647,6 @@ def readEPW(file,year=None,alias=False,warns=True):
             timezone - int
     """
     
-    datos=[]
-    with open(file,'r') as epw:
-        datos=epw.readline().split(',')
-    lat = float(datos[6])
-    lon = float(datos[7])
-    alt = float(datos[9])
-    tmz = int(datos[8].split('.')[0])
-    
     names = ['Year',
              'Month',
              'Day',
@@ -255,21 +692,42 @@ def readEPW(file,year=None,alias=False,warns=True):
              'Wind Direction'              :'Wd',
              'Wind Speed'                  :'Ws'}
     
-    data = pd.read_csv(file,skiprows=8,header=None,names=names,usecols=range(35))
-    data.Hour = data.Hour -1
+    with open(file,'rb') as epw:
+        contenido = epw.read()
+
+    ruta_cache = None
+    columnas = None
+    if cache:
+        huella = hashlib.blake2b(contenido, digest_size=16).hexdigest()
+        directorio = cache if isinstance(cache, (str, os.PathLike)) else cache_dir()
+        ruta_cache = os.path.join(directorio, f"epw-v{_EPW_CACHE_VERSION}-{huella}.npz")
+        if os.path.isfile(ruta_cache):
+            try:
+                columnas = cargar_EPW_cache(ruta_cache, names)
+                lat, lon, alt, tmz = columnas.pop('header')
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+                columnas = None
+
+    if columnas is None:
+        datos = contenido.split(b'\n', 1)[0].decode().split(',')
+        lat = float(datos[6])
+        lon = float(datos[7])
+        alt = float(datos[9])
+        tmz = int(datos[8].split('.')[0])
+
+        data = pd.read_csv(io.BytesIO(contenido),skiprows=8,header=None,names=names,usecols=range(35))
+        columnas = {name: data[name].to_numpy() for name in names}
+        if ruta_cache is not None:
+            guardar_EPW_cache(ruta_cache, columnas, names, lat, lon, alt, tmz)
+
+    data = pd.DataFrame(columnas)
     if year != None:
-        data.Year = year
+        data.Year = int(year)
         if warns == True:
             warnings.warn("Year has been changed, be carefull")
-    try:
-        data['tiempo'] = data.Year.astype('str') + '-' + data.Month.astype('str')  + '-' + data.Day.astype('str') + ' ' + data.Hour.astype('str') + ':' + data.Minute.astype('str') 
-        data.tiempo = pd.to_datetime(data.tiempo,format='%Y-%m-%d %H:%M')
-    except:
-        data.Minute = 0
-        data['tiempo'] = data.Year.astype('str') + '-' + data.Month.astype('str')  + '-' + data.Day.astype('str') + ' ' + data.Hour.astype('str') + ':' + data.Minute.astype('str') 
-        data.tiempo = pd.to_datetime(data.tiempo,format='%Y-%m-%d %H:%M')
-
-    data.set_index('tiempo',inplace=True)
+
+    data.index = EPW_index(data.Year.to_numpy(), data.Month.to_numpy(), data.Day.to_numpy(),
+                           data.Hour.to_numpy() - 1, data.Minute.to_numpy())
     del data['Year']
     del data['Month']
     del data['Day']
@@ -279,6 +737,217 @@ def readEPW(file,year=None,alias=False,warns=True):
         data.rename(columns=rename,inplace=True)
     return data, lat, lon, alt, tmz
 
+def guardar_EPW_cache(ruta_cache, columnas, names, lat, lon, alt, tmz):
+    """
+    Guarda las columnas de un EPW en formato npz de forma atómica, agrupadas por tipo
+    en arreglos contiguos; los grupos sin columnas no se guardan. Los errores se ignoran,
+    el caché solo acelera lecturas posteriores.
+    """
+    grupos = {'enteros': [], 'reales': [], 'textos': []}
+    for i, name in enumerate(names):
+        columna = columnas[name]
+        if columna.dtype.kind in 'iu':
+            grupos['enteros'].append(i)
+        elif columna.dtype.kind == 'f':
+            grupos['reales'].append(i)
+        else:
+            grupos['textos'].append(i)
+
+    tipos = {'enteros': np.int64, 'reales': np.float64, 'textos': str}
+    try:
+        arreglos = {'header': np.array([lat, lon, alt]), 'timezone': np.array(tmz)}
+        for grupo, indices in grupos.items():
+            arreglos[f'i_{grupo}'] = np.array(indices, dtype=np.int64)
+            # Un grupo vacío (p. ej. sin columnas de texto) no se guarda
+            if indices:
+                arreglos[grupo] = np.column_stack([columnas[names[i]].astype(tipos[grupo]) for i in indices])
+
+        os.makedirs(os.path.dirname(ruta_cache), exist_ok=True)
+        temporal = f"{ruta_cache}.{os.getpid()}.tmp"
+        with open(temporal, 'wb') as f:
+            np.savez(f, **arreglos)
+        os.replace(temporal, ruta_cache)
+    except (OSError, ValueError, TypeError):
+        pass
+
+def cargar_EPW_cache(ruta_cache, names):
+    """
+    Lee un archivo de guardar_EPW_cache.
+
+    Returns:
+        dict: Columnas del EPW y 'header' con (latitud, longitud, altitud, timezone).
+    """
+    columnas = {}
+    with np.load(ruta_cache, allow_pickle=False) as guardado:
+        for grupo in ['enteros', 'reales', 'textos']:
+            indices = guardado[f'i_{grupo}']
+            if len(indices) == 0:
+                continue
+            arreglo = guardado[grupo]
+            for j, i in enumerate(indices):
+                columnas[names[i]] = arreglo[:, j] if grupo != 'textos' else arreglo[:, j].astype(object)
+        lat, lon, alt = (float(v) for v in guardado['header'])
+        columnas['header'] = (lat, lon, alt, int(guardado['timezone']))
+    # Conservar el orden original de las columnas
+    return {name: columnas[name] for name in names + ['header']}
+
+def interpolate_EPW(epw, tiempos, columnas=('To', 'Ig', 'Ib', 'Id')):
+    """
+    Interpola linealmente los datos horarios de un EPW a los tiempos dados. El año del
+    archivo se toma como periódico: antes del primer registro y después del último se
+    interpola con los registros del otro extremo del año.
+
+    Args:
+        epw (DataFrame): Datos de readEPW con un solo año (parámetro year).
+        tiempos (DatetimeIndex): Tiempos locales sin zona horaria.
+        columnas (tuple, optional): Columnas a interpolar.
+
+    Returns:
+        dict: Arreglo interpolado de cada columna.
+    """
+    xp = epw.index.asi8
+    periodo = xp[-1] - xp[0] + (xp[1] - xp[0])
+    x = tiempos.asi8
+    return {columna: np.interp(x, xp, epw[columna].to_numpy(dtype=np.float64), period=periodo)
+            for columna in columnas}
+
+def EPW_index(year, month, day, hour, minute):
+    """
+    Construye el índice temporal del EPW con aritmética de fechas. Si algún minuto no
+    es válido (los EPW suelen usar 60) se toman todos los minutos como 0.
+
+    Returns:
+        pd.DatetimeIndex: Índice 'tiempo' del EPW.
+    """
+    if ((minute < 0) | (minute > 59)).any():
+        minute = np.zeros_like(minute)
+    if ((hour < 0) | (hour > 23)).any():
+        raise ValueError("hour must be in 1..24")
+
+    meses = np.asarray(year - 1970, dtype='datetime64[Y]').astype('datetime64[M]') + (month - 1)
+    dias = meses.astype('datetime64[D]') + (day - 1)
+    if (dias.astype('datetime64[M]') != meses).any() or (day < 1).any():
+        raise ValueError("day is out of range for month")
+
+    tiempo = dias.astype('datetime64[ns]') + (hour * 60 + minute).astype('timedelta64[m]')
+    return pd.DatetimeIndex(tiempo, name='tiempo')
+
+
+"""
+=============================
+    Solar position tools
+=============================
+"""
+SOLAR_POSITION_STEP = 300    # Segundos entre evaluaciones del algoritmo SPA
+_solar_days = OrderedDict()  # Días calculados: (lat, lon, alt, tz, fecha, resolución, paso) -> (posiciones, Ho, Hi)
+_solar_days_lock = threading.Lock()
+_SOLAR_DAYS_MAX = 24
+
+def _solar_vectors(posiciones):
+    # Vector unitario hacia el sol (este, norte, cenit)
+    zenith = np.radians(posiciones['zenith'].to_numpy(dtype=np.float64))
+    azimuth = np.radians(posiciones['azimuth'].to_numpy(dtype=np.float64))
+    return np.sin(zenith)*np.sin(azimuth), np.sin(zenith)*np.cos(azimuth), np.cos(zenith)
+
+def interpolate_solar_position(t_nodos, posiciones, t, index):
+    """
+    Interpola la posición solar calculada en los tiempos t_nodos a los tiempos t (en
+    segundos). Se interpola el vector unitario hacia el sol y no los ángulos, de modo que
+    el azimut no salta en 0°/360° y el error es de milésimas de grado con nodos cada 5 minutos.
+
+    Returns:
+        DataFrame: zenith, elevation, azimuth y equation_of_time con el índice dado.
+    """
+    este, norte, cenit = (np.interp(t, t_nodos, v) for v in _solar_vectors(posiciones))
+    norma = np.sqrt(este**2 + norte**2 + cenit**2)
+    zenith = np.degrees(np.arccos(np.clip(cenit/norma, -1, 1)))
+    return pd.DataFrame({'zenith': zenith,
+                         'elevation': 90 - zenith,
+                         'azimuth': np.degrees(np.arctan2(este, norte)) % 360,
+                         'equation_of_time': np.interp(t, t_nodos, posiciones['equation_of_time'].to_numpy())},
+                        index=index)
+
+def solar_position(location, tiempos, paso=SOLAR_POSITION_STEP):
+    """
+    Posición solar en tiempos con zona horaria. El algoritmo SPA de pvlib solo se evalúa
+    en los múltiplos de paso segundos que rodean a los tiempos pedidos y el resto se interpola.
+
+    Args:
+        location (pvlib.location.Location): Sitio.
+        tiempos (DatetimeIndex): Tiempos con zona horaria.
+        paso (int, optional): Segundos entre evaluaciones del SPA.
+
+    Returns:
+        DataFrame: zenith, elevation, azimuth y equation_of_time.
+    """
+    t = tiempos.asi8/1e9
+    nodos = np.floor(t/paso)
+    nodos = np.unique(np.concatenate([nodos, nodos + 1]))*paso
+    if len(nodos) >= len(tiempos):
+        return location.get_solarposition(tiempos)[['zenith', 'elevation', 'azimuth', 'equation_of_time']]
+
+    posiciones = location.get_solarposition(pd.to_datetime(nodos, unit='s', utc=True))
+    return interpolate_solar_position(nodos, posiciones, t, tiempos)
+
+def solar_days(location, fechas, resolution, paso=SOLAR_POSITION_STEP):
+    """
+    Posición solar de días completos cada resolution segundos, con la salida (Ho) y puesta
+    (Hi) del sol. Los días se guardan por (latitud, longitud, altitud, zona horaria,
+    fecha, resolución) y el SPA de los que faltan se evalúa en una sola llamada, en una
+    malla de paso segundos cuando la resolución es más fina.
+
+    Args:
+        location (pvlib.location.Location): Sitio con zona horaria.
+        fechas (list): Fechas 'YYYY-MM-DD'.
+        resolution (int): Segundos entre tiempos del día.
+        paso (int, optional): Segundos entre evaluaciones del SPA.
+
+    Returns:
+        list: (posiciones, Ho, Hi) de cada fecha; las posiciones son una copia.
+    """
+    claves = [(location.latitude, location.longitude, location.altitude, str(location.tz),
+               str(pd.Timestamp(fecha).date()), resolution, paso) for fecha in fechas]
+    resultados = {}
+    with _solar_days_lock:
+        for clave in claves:
+            if clave in _solar_days:
+                _solar_days.move_to_end(clave)
+                resultados[clave] = _solar_days[clave]
+    faltantes = list(dict.fromkeys(clave for clave in claves if clave not in resultados))
+
+    if faltantes:
+        dias = [pd.date_range(f'{clave[4]} 00:00', f'{clave[4]} 23:59', freq=f'{resolution}s', tz=location.tz)
+                for clave in faltantes]
+        gruesa = resolution < paso
+        if gruesa:
+            n = int(np.ceil(86400/paso)) + 1
+            nodos = [pd.date_range(f'{clave[4]} 00:00', periods=n, freq=f'{paso}s', tz=location.tz)
+                     for clave in faltantes]
+        else:
+            nodos = dias
+        posiciones = location.get_solarposition(nodos[0].append(nodos[1:]))
+
+        inicio = 0
+        for clave, dia, nodo in zip(faltantes, dias, nodos):
+            p = posiciones.iloc[inicio:inicio + len(nodo)]
+            inicio += len(nodo)
+            t_nodos = (nodo - nodo[0]).total_seconds().to_numpy()
+            if gruesa:
+                t = (dia - dia[0]).total_seconds().to_numpy()
+                p_dia = interpolate_solar_position(t_nodos, p, t, dia)
+            else:
+                p_dia = p[['zenith', 'elevation', 'azimuth', 'equation_of_time']].copy()
+            Ho, Hi = horas_sol(t_nodos, p['elevation'].to_numpy(dtype=np.float64))
+            resultados[clave] = (p_dia, Ho, Hi)
+
+        with _solar_days_lock:
+            for clave in faltantes:
+                _solar_days[clave] = resultados[clave]
+                _solar_days.move_to_end(clave)
+            while len(_solar_days) > _SOLAR_DAYS_MAX:
+                _solar_days.popitem(last=False)
+
+    return [(resultados[clave][0].copy(), *resultados[clave][1:]) for clave in claves]
 
 """
 =============================
@@ -286,6 +955,34 @@ def readEPW(file,year=None,alias=False,warns=True):
 =============================
 """
 
+def sample_dataframe(df, dt):
+    """
+    Obtiene las filas del DataFrame en los pasos temporales del solver. Si la resolución
+    del DataFrame divide a dt se toman las filas directamente; si no, las columnas
+    numéricas se interpolan linealmente en una malla con paso dt, considerando que
+    el día es periódico con periodo de 86400 s (el día promedio termina a las 23:59).
+
+    Args:
+        df (pd.DataFrame): DataFrame con índice temporal uniforme (meanDay, Tsa).
+        dt (float): Paso temporal en segundos.
+
+    Returns:
+        pd.DataFrame: DataFrame en los pasos temporales del solver.
+    """
+    if len(df.index) < 2:
+        return df
+    paso = (df.index[1] - df.index[0]).total_seconds()
+    if dt % paso == 0:
+        return df.iloc[::int(dt // paso)]
+
+    periodo = 86400
+    tiempo = pd.date_range(start=df.index[0], periods=int(periodo // dt), freq=f'{dt}s')
+    x = tiempo.asi8 - df.index.asi8[0]
+    xp = df.index.asi8 - df.index.asi8[0]
+    columnas = df.select_dtypes(include='number').columns
+    return pd.DataFrame({columna: np.interp(x, xp, df[columna].to_numpy(dtype=np.float64), period=periodo * 1e9)
+                         for columna in columnas}, index=tiempo)
+
 def set_construction(propiedades, tuplas):
     """
     Actualiza el diccionario cs con  las propiedades del material y los valores de L proporcionados en las tuplas.
@@ -306,6 +1003,147 @@ def set_construction(propiedades, tuplas):
         }
     return cs
 
+def construction_profile(propiedades, constructive_system, nx, mesh=None):
+    """
+    Devuelve los arreglos (k, rhoc, dx) de set_k_rhoc, o de set_k_rhoc_layers si se da una
+    malla por capas, para un sistema constructivo usando un caché LRU acotado, con llave en
+    las capas (material, L y sus propiedades), nx y la malla. Los arreglos devueltos son de
+    solo lectura porque se comparten entre llamadas.
+
+    Args:
+        propiedades (dict): Diccionario con las propiedades de los materiales.
+        constructive_system (list): Lista de tuplas (material, L) del exterior al interior.
+        nx (int): Número de elementos de discretización, sin uso con una malla por capas.
+        mesh (LayerMesh, optional): Malla por capas.
+
+    Returns:
+        tuple : [ k_array, rhoc_array, dx ] como en set_k_rhoc o set_k_rhoc_layers.
+    """
+    clave = tuple((material, L, propiedades[material].k, propiedades[material].rho, propiedades[material].c)
+                  for material, L in constructive_system)
+    return _construction_profile(clave, nx, mesh)
+
+@functools.lru_cache(maxsize=1024)
+def _construction_profile(clave, nx, mesh):
+    cs = {f"L{i}": {"L": L, "material": Material(k, rho, c)}
+          for i, (_, L, k, rho, c) in enumerate(clave, start=1)}
+    if mesh is None:
+        k_array, rhoc_array, dx = set_k_rhoc(cs, nx)
+    else:
+        k_array, rhoc_array, dx = set_k_rhoc_layers(cs, mesh.min_cells, mesh.dx_max, mesh.grading,
+                                                    mesh.refinement)
+        dx.flags.writeable = False
+    k_array.flags.writeable = False
+    rhoc_array.flags.writeable = False
+    return k_array, rhoc_array, dx
+
+def stack_profiles(propiedades, constructive_systems, nx, mesh=None):
+    """
+    Apila los perfiles de construction_profile de varios sistemas constructivos para los
+    kernels por lotes. Con una malla por capas cada sistema tiene su propio número de
+    volúmenes y las filas se rellenan hasta el mayor.
+
+    Args:
+        propiedades (dict): Diccionario con las propiedades de los materiales.
+        constructive_systems (list): Sistemas constructivos, listas de tuplas (material, L).
+        nx (int): Número de elementos de discretización, sin uso con una malla por capas.
+        mesh (LayerMesh, optional): Malla por capas.
+
+    Returns:
+        tuple: (k, rhoc, dx, nodos) arreglos (sistemas, volúmenes) y número de volúmenes de
+        cada sistema.
+    """
+    perfiles = [construction_profile(propiedades, sistema, nx, mesh) for sistema in constructive_systems]
+    nodos = np.array([len(k) for k, _, _ in perfiles], dtype=np.int64)
+    n = nodos.max() if len(perfiles) else nx
+
+    k = np.ones((len(perfiles), n))
+    rhoc = np.ones((len(perfiles), n))
+    dx = np.ones((len(perfiles), n))
+    for s, (k_s, rhoc_s, dx_s) in enumerate(perfiles):
+        k[s, :nodos[s]] = k_s
+        rhoc[s, :nodos[s]] = rhoc_s
+        dx[s, :nodos[s]] = dx_s
+    return k, rhoc, dx, nodos
+
+_warm_starts = OrderedDict()    # Soluciones periódicas recientes por secuencia de materiales
+_WARM_STARTS_MAX = 256
+_warm_starts_lock = threading.Lock()
+
+def _warm_start_key(constructive_system, nt, config):
+    # La malla entra en la llave, pero no nx: con una malla por capas nx cambia con los espesores
+    malla = config.Nx if config.mesh is None else config.mesh
+    return (tuple(material for material, _ in constructive_system), malla, config.dt, nt,
+            config.ho, config.hi, config.La)
+
+def _layer_coordinates(anchos, dx):
+    """
+    Posición de los centros de los volúmenes de control de tamaños dx expresada como índice
+    de capa más la fracción recorrida dentro de esa capa, para comparar sistemas con los
+    mismos materiales y distintos espesores.
+    """
+    anchos = np.asarray(anchos, dtype=np.float64)
+    bordes = np.concatenate(([0.0], np.cumsum(anchos)))
+    x = np.cumsum(dx) - dx / 2
+    capa = np.clip(np.searchsorted(bordes, x, side='right') - 1, 0, len(anchos) - 1)
+    return capa + (x - bordes[capa]) / anchos[capa]
+
+def get_warm_start(constructive_system, dx, nt, Tref, config):
+    """
+    Devuelve la última solución periódica guardada con store_warm_start para la misma
+    secuencia de materiales, malla (Nx o LayerMesh), dt, ho, hi, La y número de pasos. Los
+    espesores no forman parte de la llave: el perfil guardado se interpola a la nueva
+    geometría según la posición dentro de cada capa y se desplaza a la temperatura de
+    referencia nueva, así que en un barrido de espesores o absortancias cada corrida arranca
+    de la solución de su vecina.
+
+    Args:
+        constructive_system (list): Lista de tuplas (material, L) del exterior al interior.
+        dx (numpy.ndarray): Tamaño de cada volumen de control.
+        nt (int): Número de pasos temporales del día.
+        Tref (float): Temperatura de referencia, la media de Tsa, que es la media del perfil periódico.
+        config (SimulationConfig): Configuración de la simulación.
+
+    Returns:
+        tuple: (T, Ti) perfil de temperaturas y temperatura interior, o None.
+    """
+    with _warm_starts_lock:
+        guardado = _warm_starts.get(_warm_start_key(constructive_system, nt, config))
+    if guardado is None:
+        return None
+    anchos, dx_guardado, T, Ti = guardado
+    nuevos = [L for _, L in constructive_system]
+    if nuevos != anchos or len(dx) != len(dx_guardado):
+        T = np.interp(_layer_coordinates(nuevos, dx), _layer_coordinates(anchos, dx_guardado), T)
+    return T + Tref, Ti + Tref
+
+def store_warm_start(constructive_system, dx, T, Ti, Tref, config):
+    """
+    Guarda una solución periódica para get_warm_start, descartando la más antigua cuando
+    hay más de 256 guardadas.
+
+    Args:
+        constructive_system (list): Lista de tuplas (material, L) del exterior al interior.
+        dx (numpy.ndarray): Tamaño de cada volumen de control.
+        T (numpy.ndarray): Perfil de temperaturas al final del día.
+        Ti (numpy.ndarray): Temperatura interior en cada paso temporal.
+        Tref (float): Temperatura de referencia, ver get_warm_start.
+        config (SimulationConfig): Configuración de la simulación.
+    """
+    clave = _warm_start_key(constructive_system, len(Ti), config)
+    with _warm_starts_lock:
+        _warm_starts[clave] = ([L for _, L in constructive_system], np.array(dx), T - Tref, Ti - Tref)
+        _warm_starts.move_to_end(clave)
+        while len(_warm_starts) > _WARM_STARTS_MAX:
+            _warm_starts.popitem(last=False)
+
+def clear_warm_starts():
+    """
+    Elimina las soluciones guardadas para get_warm_start.
+    """
+    with _warm_starts_lock:
+        _warm_starts.clear()
+
 def get_total_L(cs):
     L_total = sum([cs[L]["L"] for L in cs.keys()])
     return L_total
@@ -355,14 +1193,87 @@ def set_k_rhoc(cs, nx):
 
     return k_array, rhoc_array, dx
 
-@njit
+def graded_cells(L, n, ratio):
+    """
+    Divide un espesor L en n volúmenes cuyo tamaño crece por el factor ratio.
+
+    Args:
+        L (float): Espesor a dividir.
+        n (int): Número de volúmenes.
+        ratio (float): Razón entre volúmenes consecutivos, 1 para volúmenes iguales.
+
+    Returns:
+        numpy.ndarray: Tamaño de cada volumen, del más pequeño al más grande.
+    """
+    if n == 0:
+        return np.zeros(0)
+    if ratio == 1:
+        return np.full(n, L / n)
+    return L * (ratio - 1) / (ratio**n - 1) * ratio**np.arange(n)
+
+def set_k_rhoc_layers(cs, min_cells, dx_max, grading=1.0, refinement=0):
+    """
+    Calcula los arreglos de conductividad, del producto de calor específico y densidad y
+    del tamaño de cada volumen de control para una malla no uniforme: cada capa se divide
+    en max(min_cells, ceil(L/dx_max)) volúmenes, así que las interfaces entre materiales
+    coinciden con caras de los volúmenes. En las capas exterior e interior los volúmenes
+    crecen por el factor grading desde la superficie. Con refinement > 0 cada volumen se
+    divide en 2**refinement volúmenes que crecen por grading**(1/2**refinement), de modo
+    que las caras de la malla original se conservan.
+
+    Args:
+        cs (dict): Diccionario con la configuración del sistema constructivo.
+        min_cells (int): Número mínimo de volúmenes por capa.
+        dx_max (float): Tamaño medio de los volúmenes de cada capa.
+        grading (float, optional): Razón entre volúmenes consecutivos junto a las superficies.
+        refinement (int, optional): Número de veces que se divide en dos cada volumen.
+
+    Returns:
+        tuple : [ k_array, rhoc_array, dx_array ] con un valor por volumen de control.
+    """
+    k_array, rhoc_array, dx_array = [], [], []
+    capas = list(cs.values())
+    for i, capa in enumerate(capas):
+        L_value = capa['L']
+        material = capa['material']
+        # La tolerancia evita un volumen extra cuando L/dx_max es entero salvo por redondeo
+        num_elements = max(min_cells, math.ceil(L_value / dx_max - 1e-9))
+        ratio = grading**(1 / 2**refinement)
+
+        if len(capas) == 1:
+            # Una sola capa: la mitad de los volúmenes crece desde cada superficie
+            mitad = num_elements // 2
+            # Las mitades se reparten antes de refinar para conservar la proporción
+            exterior = (num_elements - mitad) * 2**refinement
+            interior = mitad * 2**refinement
+            tamaños = np.concatenate((graded_cells(L_value / 2, exterior, ratio),
+                                      graded_cells(L_value / 2, interior, ratio)[::-1]))
+            num_elements = exterior + interior
+        else:
+            num_elements *= 2**refinement
+            if i == 0:
+                tamaños = graded_cells(L_value, num_elements, ratio)
+            elif i == len(capas) - 1:
+                tamaños = graded_cells(L_value, num_elements, ratio)[::-1]
+            else:
+                tamaños = graded_cells(L_value, num_elements, 1.0)
+
+        k_array += [material.k] * num_elements
+        rhoc_array += [material.rho * material.c] * num_elements
+        dx_array += list(tamaños)
+
+    return np.array(k_array), np.array(rhoc_array), np.array(dx_array)
+
+@njit(nogil=True, cache=True)
 def calculate_coefficients(dt, dx, k, nx, rhoc, T, To, ho, Ti, hi):
     """
-    Calcula los coeficientes a, b, c y d para el sistema de ecuaciones.
+    Calcula los coeficientes a, b, c y d para el sistema de ecuaciones. La conductancia
+    entre dos volúmenes vecinos es 1/(dx_i/2k_i + dx_j/2k_j), que con un dx uniforme es el
+    promedio armónico de k entre dx.
 
     Parameters:
     dt (float): Paso temporal.
-    dx (float): Tamaño de cada volumen de control.
+    dx (float or numpy.ndarray): Tamaño de los volúmenes de control, uno solo o uno por volumen.
     k (numpy.ndarray): Arreglo de conductividades.
     nx (int): Número de elementos de discretización.
     rhoc (numpy.ndarray): Arreglo del producto de densidad y calor específico.
@@ -379,30 +1290,31 @@ def calculate_coefficients(dt, dx, k, nx, rhoc, T, To, ho, Ti, hi):
     b = np.zeros(nx)
     c = np.zeros(nx)
     d = np.zeros(nx)
+    dx = np.zeros(nx) + dx
 
     # Calcular coeficientes en el primer nodo
-    b[0] = (2.0 * k[0] * k[1]) / (k[0] + k[1]) / dx
+    b[0] = (2.0 * k[0] * k[1]) / (k[0] * (dx[1] / dx[0]) + k[1]) / dx[0]
     c[0] = 0.0
-    d[0] = rhoc[0] * dx / dt * T[0] + ho * To
-    a[0] = rhoc[0] * dx / dt + ho + b[0]
+    d[0] = rhoc[0] * dx[0] / dt * T[0] + ho * To
+    a[0] = rhoc[0] * dx[0] / dt + ho + b[0]
     
     # Calcular coeficientes en los nodos intermedios
     for i in range(1, nx -1):
-        b[i] = (2.0 * k[i] * k[i + 1]) / (k[i] + k[i + 1]) / dx
-        c[i] = (2.0 * k[i - 1] * k[i]) / (k[i] + k[i - 1]) / dx
-        d[i] = rhoc[i] * dx / dt * T[i]
-        a[i] = rhoc[i] * dx / dt + b[i] + c[i]
+        b[i] = (2.0 * k[i] * k[i + 1]) / (k[i] * (dx[i + 1] / dx[i]) + k[i + 1]) / dx[i]
+        c[i] = (2.0 * k[i - 1] * k[i]) / (k[i] + k[i - 1] * (dx[i] / dx[i - 1])) / dx[i - 1]
+        d[i] = rhoc[i] * dx[i] / dt * T[i]
+        a[i] = rhoc[i] * dx[i] / dt + b[i] + c[i]
     
     # Calcular coeficientes en el último nodo
     i = nx - 1
     b[i] = 0.0
-    c[i] = (2.0 * k[i - 1] * k[i]) / (k[i] + k[i - 1]) / dx
-    d[i] = rhoc[i] * dx / dt * T[i] + hi * Ti
-    a[i] = rhoc[i] * dx / dt + c[i] + hi
+    c[i] = (2.0 * k[i - 1] * k[i]) / (k[i] + k[i - 1] * (dx[i] / dx[i - 1])) / dx[i - 1]
+    d[i] = rhoc[i] * dx[i] / dt * T[i] + hi * Ti
+    a[i] = rhoc[i] * dx[i] / dt + c[i] + hi
 
     return a, b, c, d
 
-@njit
+@njit(nogil=True, cache=True)
 def solve_PQ(a, b, c, d, T, nx, Tint, hi, La, dt):
     """
     Resuelve el sistema de ecuaciones usando el método TDMA y actualiza las temperaturas para el siguiente paso temporal.
@@ -451,10 +1363,661 @@ def solve_PQ(a, b, c, d, T, nx, Tint, hi, La, dt):
 
     return T, Tint
 
-def solve_PQ_AC(a, b, c, d, T, nx, Tint, hi, La, dt):
-    """Función para resolver PQ con A/C. Aún no implementada
+TDMAFactor = namedtuple("TDMAFactor", ["P", "c", "den", "cap"])
+
+@njit(nogil=True, cache=True)
+def factorize_TDMA(dt, dx, k, nx, rhoc, ho, hi):
+    """
+    Calcula una sola vez la eliminación hacia adelante del método TDMA. Los coeficientes
+    a, b y c solo dependen de k, rhoc, dx, dt, ho y hi, por lo que la factorización
+    se reutiliza en todos los pasos temporales y solo se recalcula el lado derecho.
+
+    Args:
+        dt (float): Paso temporal.
+        dx (float or numpy.ndarray): Tamaño de los volúmenes de control, uno solo o uno por volumen.
+        k (numpy.ndarray): Arreglo de conductividades.
+        nx (int): Número de elementos de discretización.
+        rhoc (numpy.ndarray): Arreglo del producto de densidad y calor específico.
+        ho (float): Coeficiente convectivo en el exterior.
+        hi (float): Coeficiente convectivo en el interior.
+
+    Returns:
+        TDMAFactor: (P, c, den, cap) coeficientes de eliminación, coeficientes c,
+        denominadores de la eliminación y capacitancias rhoc*dx/dt.
+    """
+    a, b, c, _ = calculate_coefficients(dt, dx, k, nx, rhoc, np.zeros(nx), 0.0, ho, 0.0, hi)
+    P = np.zeros(nx)
+    den = np.zeros(nx)
+    cap = np.zeros(nx)
+
+    den[0] = a[0]
+    P[0] = b[0] / den[0]
+    for i in range(1, nx):
+        den[i] = a[i] - c[i] * P[i - 1]
+        P[i] = b[i] / den[i]
+
+    dx = np.zeros(nx) + dx
+    for i in range(nx):
+        cap[i] = rhoc[i] * dx[i] / dt
+
+    return TDMAFactor(P, c, den, cap)
+
+@njit(nogil=True, cache=True)
+def solve_factored(factor, T, To, ho, Tint, hi, nx, La, dt, Q):
+    """
+    Avanza un paso temporal con una factorización de factorize_TDMA: solo calcula el
+    barrido del lado derecho y la sustitución hacia atrás, y actualiza la temperatura interior.
+
+    Args:
+        factor (TDMAFactor): Factorización de la construcción.
+        T (numpy.ndarray): Arreglo de temperaturas, se actualiza in situ.
+        To (float): Temperatura en el exterior.
+        ho (float): Coeficiente convectivo en el exterior.
+        Tint (float): Temperatura interna.
+        hi (float): Coeficiente convectivo interno.
+        nx (int): Número de elementos de discretización.
+        La (float): Longitud del cuarto ficticio.
+        dt (float): Paso temporal.
+        Q (numpy.ndarray): Arreglo de trabajo de tamaño nx.
+
+    Returns:
+        float: Temperatura interna actualizada.
+    """
+    rhoair  = 1.1797660470258469
+    cair    = 1005.458757
+    P, c, den, cap = factor
+
+    Q[0] = (cap[0] * T[0] + ho * To) / den[0]
+    for i in range(1, nx - 1):
+        Q[i] = (cap[i] * T[i] + c[i] * Q[i - 1]) / den[i]
+    i = nx - 1
+    Q[i] = (cap[i] * T[i] + hi * Tint + c[i] * Q[i - 1]) / den[i]
+
+    T[nx - 1] = Q[nx - 1]
+    for i in range(nx - 2, -1, -1):
+        T[i] = P[i] * T[i + 1] + Q[i]
+
+    Tinn = Tint
+    Tint += hi * dt / (rhoair * cair * La) * (T[nx - 1] - Tinn)
+
+    return Tint
+
+@njit(nogil=True, cache=True)
+def solve_periodic(Tsa, k, rhoc, dx, nx, T, Ti, ho, hi, La, dt):
+    """
+    Resuelve el día promedio de forma periódica: repite el día completo hasta que
+    el cambio medio del perfil de temperaturas entre pasadas sea menor a 5e-4.
+
+    Args:
+        Tsa (numpy.ndarray): Temperatura sol-aire en cada paso temporal.
+        k (numpy.ndarray): Arreglo de conductividades.
+        rhoc (numpy.ndarray): Arreglo del producto de densidad y calor específico.
+        dx (float): Tamaño de cada volumen de control.
+        nx (int): Número de elementos de discretización.
+        T (numpy.ndarray): Perfil inicial de temperaturas, se actualiza in situ.
+        Ti (numpy.ndarray): Temperatura interior inicial en cada paso temporal, se actualiza in situ.
+        ho (float): Coeficiente convectivo en el exterior.
+        hi (float): Coeficiente convectivo en el interior.
+        La (float): Longitud del cuarto ficticio.
+        dt (float): Paso temporal.
+
+    Returns:
+        tuple: (T, Ti, C, historia) perfil de temperaturas al final del día, temperatura
+        interior en cada paso temporal, cambio medio de la última pasada y cambio medio de
+        cada pasada (su longitud es el número de pasadas).
+    """
+    factor = factorize_TDMA(dt, dx, k, nx, rhoc, ho, hi)
+    Q = np.zeros(nx)
+    Told = np.zeros(nx)
+    historia = np.empty(64)
+
+    C = 1.0
+    iteraciones = 0
+    while C > 5e-4:
+        Told[:] = T
+        for j in range(Tsa.shape[0]):
+            Ti[j] = solve_factored(factor, T, Tsa[j], ho, Ti[j], hi, nx, La, dt, Q)
+        C = np.abs(Told - T).mean()
+
+        if iteraciones == historia.shape[0]:
+            anterior = historia
+            historia = np.empty(2*anterior.shape[0])
+            historia[:iteraciones] = anterior
+        historia[iteraciones] = C
+        iteraciones += 1
+
+    return T, Ti, C, historia[:iteraciones].copy()
+
+@njit(nogil=True, cache=True)
+def solve_periodic_anderson(Tsa, k, rhoc, dx, nx, T, Ti, ho, hi, La, dt, m=5, tol=5e-4):
+    """
+    Resuelve el día promedio de forma periódica como solve_periodic, pero extrapola el
+    estado al final de cada día (perfil T y temperaturas interiores Ti) con la aceleración
+    de Anderson sobre las últimas m pasadas. Se detiene cuando el mayor cambio del estado
+    completo (T y Ti) en una pasada es menor que tol (5e-4 por omisión), más estricto que el cambio medio de
+    T de solve_periodic porque la extrapolación puede fijar T antes que Ti. Necesita muchas
+    menos pasadas para sistemas con mucha masa térmica.
+
+    Args:
+        Tsa (numpy.ndarray): Temperatura sol-aire en cada paso temporal.
+        k (numpy.ndarray): Arreglo de conductividades.
+        rhoc (numpy.ndarray): Arreglo del producto de densidad y calor específico.
+        dx (float): Tamaño de cada volumen de control.
+        nx (int): Número de elementos de discretización.
+        T (numpy.ndarray): Perfil inicial de temperaturas, se actualiza in situ.
+        Ti (numpy.ndarray): Temperatura interior inicial en cada paso temporal, se actualiza in situ.
+        ho (float): Coeficiente convectivo en el exterior.
+        hi (float): Coeficiente convectivo en el interior.
+        La (float): Longitud del cuarto ficticio.
+        dt (float): Paso temporal.
+        m (int, optional): Número de pasadas anteriores usadas en la extrapolación.
+        tol (float, optional): Mayor cambio del estado para detenerse.
+
+    Returns:
+        tuple: (T, Ti, C, historia) como solve_periodic, con el mayor cambio del estado en
+        lugar del cambio medio de T.
+    """
+    factor = factorize_TDMA(dt, dx, k, nx, rhoc, ho, hi)
+    Q = np.zeros(nx)
+    nt = Tsa.shape[0]
+    n = nx + nt
+    historia = np.empty(64)
+
+    x = np.empty(n)                 # estado al inicio de la pasada
+    g = np.empty(n)                 # cambio producido por la pasada
+    x_anterior = np.empty(n)
+    g_anterior = np.empty(n)
+    dX = np.zeros((n, m))
+    dG = np.zeros((n, m))
+    columnas = 0
+    siguiente = 0
+
+    C = 1.0
+    iteraciones = 0
+    while C > tol:
+        x[:nx] = T
+        x[nx:] = Ti
+        for j in range(nt):
+            Ti[j] = solve_factored(factor, T, Tsa[j], ho, Ti[j], hi, nx, La, dt, Q)
+        g[:nx] = T - x[:nx]
+        g[nx:] = Ti - x[nx:]
+        C = np.abs(g).max()
+
+        if iteraciones == historia.shape[0]:
+            anterior = historia
+            historia = np.empty(2*anterior.shape[0])
+            historia[:iteraciones] = anterior
+        historia[iteraciones] = C
+        iteraciones += 1
+        if C <= tol:
+            break
+
+        if iteraciones > 1:
+            dX[:, siguiente] = x - x_anterior
+            dG[:, siguiente] = g - g_anterior
+            siguiente = (siguiente + 1) % m
+            columnas = min(columnas + 1, m)
+        x_anterior[:] = x
+        g_anterior[:] = g
+
+        # x + g es la pasada sin acelerar; se corrige con la combinación de pasadas anteriores
+        nuevo = x + g
+        if columnas > 0:
+            gamma = np.linalg.lstsq(dG[:, :columnas], g)[0]
+            nuevo -= (dX[:, :columnas] + dG[:, :columnas]) @ gamma
+        T[:] = nuevo[:nx]
+        Ti[:] = nuevo[nx:]
+
+    return T, Ti, C, historia[:iteraciones].copy()
+
+@njit(nogil=True, cache=True)
+def solve_periodic_direct(Tsa, k, rhoc, dx, nx, ho, La, dt):
+    """
+    Calcula directamente la solución periódica del día promedio. En el estado periódico
+    la temperatura interior es igual a la de la superficie interior, por lo que el día
+    completo es un mapa lineal T_final = M T_inicial + g; se construye M propagando
+    perfiles unitarios durante un día y se resuelve (I - M) T = g una sola vez.
+
+    Args:
+        Tsa (numpy.ndarray): Temperatura sol-aire en cada paso temporal.
+        k (numpy.ndarray): Arreglo de conductividades.
+        rhoc (numpy.ndarray): Arreglo del producto de densidad y calor específico.
+        dx (float): Tamaño de cada volumen de control.
+        nx (int): Número de elementos de discretización.
+        ho (float): Coeficiente convectivo en el exterior.
+        La (float): Longitud del cuarto ficticio.
+        dt (float): Paso temporal.
+
+    Returns:
+        tuple: (T, Ti, residual) perfil periódico de temperaturas, temperatura interior en cada
+        paso temporal y cambio medio del perfil tras simular un día desde la solución.
+    """
+    nt = Tsa.shape[0]
+    # Superficie interior sin flujo hacia el aire: hi solo aparece en la actualización de Ti
+    factor = factorize_TDMA(dt, dx, k, nx, rhoc, ho, 0.0)
+    Q = np.zeros(nx)
+    T = np.zeros(nx)
+
+    # Respuesta a perfiles iniciales unitarios, todas las columnas de M a la vez
+    P, c, den, cap = factor
+    M = np.eye(nx)
+    QM = np.zeros((nx, nx))
+    for j in range(nt):
+        for col in range(nx):
+            QM[0, col] = cap[0] * M[0, col] / den[0]
+        for i in range(1, nx):
+            for col in range(nx):
+                QM[i, col] = (cap[i] * M[i, col] + c[i] * QM[i - 1, col]) / den[i]
+        for col in range(nx):
+            M[nx - 1, col] = QM[nx - 1, col]
+        for i in range(nx - 2, -1, -1):
+            for col in range(nx):
+                M[i, col] = P[i] * M[i + 1, col] + QM[i, col]
+
+    # Respuesta forzada por Tsa desde un perfil nulo
+    T[:] = 0.0
+    for j in range(nt):
+        solve_factored(factor, T, Tsa[j], ho, 0.0, 0.0, nx, La, dt, Q)
+
+    T0 = np.linalg.solve(np.eye(nx) - M, T.copy())
+
+    # Un día desde la solución periódica para obtener Ti y el residual
+    Ti = np.zeros(nt)
+    T[:] = T0
+    for j in range(nt):
+        solve_factored(factor, T, Tsa[j], ho, 0.0, 0.0, nx, La, dt, Q)
+        Ti[j] = T[nx - 1]
+    residual = np.abs(T - T0).mean()
+
+    return T, Ti, residual
+
+@njit(nogil=True, cache=True)
+def solve_transient(Tsa, k, rhoc, dx, nx, T, Ti, ho, hi, La, dt):
+    """
+    Avanza el sistema constructivo y el cuarto ficticio paso a paso sin repetir el día:
+    la temperatura interior de cada paso parte de la del paso anterior, así que llamadas
+    sucesivas con el T y el último Ti devueltos continúan la misma simulación.
+
+    Args:
+        Tsa (numpy.ndarray): Temperatura sol-aire en cada paso temporal.
+        k (numpy.ndarray): Arreglo de conductividades.
+        rhoc (numpy.ndarray): Arreglo del producto de densidad y calor específico.
+        dx (float or numpy.ndarray): Tamaño de los volúmenes de control.
+        nx (int): Número de elementos de discretización.
+        T (numpy.ndarray): Perfil de temperaturas al inicio, se actualiza in situ.
+        Ti (float): Temperatura interior al inicio.
+        ho (float): Coeficiente convectivo en el exterior.
+        hi (float): Coeficiente convectivo en el interior.
+        La (float): Longitud del cuarto ficticio.
+        dt (float): Paso temporal.
+
+    Returns:
+        tuple: (T, Ti) perfil de temperaturas al final y temperatura interior en cada paso.
+    """
+    factor = factorize_TDMA(dt, dx, k, nx, rhoc, ho, hi)
+    Q = np.zeros(nx)
+    salida = np.empty(Tsa.shape[0])
+
+    for j in range(Tsa.shape[0]):
+        Ti = solve_factored(factor, T, Tsa[j], ho, Ti, hi, nx, La, dt, Q)
+        salida[j] = Ti
+
+    return T, salida
+
+@njit(parallel=True, nogil=True, cache=True)
+def solve_periodic_batch(Tsa, k, rhoc, dx, nx, T, Ti, ho, hi, La, dt):
+    """
+    Resuelve varios sistemas constructivos en paralelo con solve_periodic, un sistema por hilo.
+
+    Args:
+        Tsa (numpy.ndarray): Temperatura sol-aire, arreglo (sistemas, pasos temporales).
+        k (numpy.ndarray): Conductividades, arreglo (sistemas, volúmenes) como en stack_profiles.
+        rhoc (numpy.ndarray): Producto de densidad y calor específico, arreglo (sistemas, volúmenes).
+        dx (numpy.ndarray): Tamaño de los volúmenes de control, arreglo (sistemas, volúmenes).
+        nx (numpy.ndarray): Número de volúmenes de cada sistema.
+        T (numpy.ndarray): Perfiles iniciales de temperatura (sistemas, volúmenes), se actualizan in situ.
+        Ti (numpy.ndarray): Temperaturas interiores iniciales (sistemas, pasos temporales), se actualizan in situ.
+        ho (float): Coeficiente convectivo en el exterior.
+        hi (float): Coeficiente convectivo en el interior.
+        La (float): Longitud del cuarto ficticio.
+        dt (float): Paso temporal.
+
+    Returns:
+        tuple: (T, Ti) perfiles de temperatura y temperaturas interiores de cada sistema.
+    """
+    for s in prange(k.shape[0]):
+        n = nx[s]
+        solve_periodic(Tsa[s], k[s, :n], rhoc[s, :n], dx[s, :n], n, T[s, :n], Ti[s], ho, hi, La, dt)
+
+    return T, Ti
+
+@njit(parallel=True, nogil=True, cache=True)
+def solve_periodic_direct_batch(Tsa, k, rhoc, dx, nx, T, Ti, ho, La, dt):
+    """
+    Resuelve varios sistemas constructivos en paralelo con solve_periodic_direct, un sistema por hilo.
+
+    Args:
+        Tsa (numpy.ndarray): Temperatura sol-aire, arreglo (sistemas, pasos temporales).
+        k (numpy.ndarray): Conductividades, arreglo (sistemas, volúmenes) como en stack_profiles.
+        rhoc (numpy.ndarray): Producto de densidad y calor específico, arreglo (sistemas, volúmenes).
+        dx (numpy.ndarray): Tamaño de los volúmenes de control, arreglo (sistemas, volúmenes).
+        nx (numpy.ndarray): Número de volúmenes de cada sistema.
+        T (numpy.ndarray): Arreglo (sistemas, volúmenes) donde se guardan los perfiles periódicos.
+        Ti (numpy.ndarray): Arreglo (sistemas, pasos temporales) donde se guardan las temperaturas interiores.
+        ho (float): Coeficiente convectivo en el exterior.
+        La (float): Longitud del cuarto ficticio.
+        dt (float): Paso temporal.
+
+    Returns:
+        tuple: (T, Ti) perfiles periódicos y temperaturas interiores de cada sistema.
+    """
+    for s in prange(k.shape[0]):
+        n = nx[s]
+        T[s, :n], Ti[s], _ = solve_periodic_direct(Tsa[s], k[s, :n], rhoc[s, :n], dx[s, :n], n, ho, La, dt)
+
+    return T, Ti
+
+@njit(nogil=True, cache=True)
+def solve_room_periodic(Tsa, k, rhoc, dx, nx, area, T, Ti, ho, hi, La, dt):
+    """
+    Resuelve de forma periódica varias superficies (muros y techo) de un mismo cuarto que
+    comparten la temperatura interior. En cada paso temporal se avanzan los sistemas de
+    todas las superficies con la misma Ti y el aire se actualiza con la temperatura
+    superficial interior promedio, ponderada por área, como en solve_factored. El cuarto
+    tiene un volumen de La por el área total, así que con una sola superficie se obtiene
+    el resultado de solve_periodic.
+
+    Args:
+        Tsa (numpy.ndarray): Temperatura sol-aire, arreglo (superficies, pasos temporales).
+        k (numpy.ndarray): Conductividades, arreglo (superficies, volúmenes) como en stack_profiles.
+        rhoc (numpy.ndarray): Producto de densidad y calor específico, arreglo (superficies, volúmenes).
+        dx (numpy.ndarray): Tamaño de los volúmenes de control, arreglo (superficies, volúmenes).
+        nx (numpy.ndarray): Número de volúmenes de cada superficie.
+        area (numpy.ndarray): Área de cada superficie.
+        T (numpy.ndarray): Perfiles iniciales de temperatura (superficies, volúmenes), se actualizan in situ.
+        Ti (numpy.ndarray): Temperatura interior inicial en cada paso temporal, se actualiza in situ.
+        ho (float): Coeficiente convectivo en el exterior.
+        hi (float): Coeficiente convectivo en el interior.
+        La (float): Longitud del cuarto ficticio.
+        dt (float): Paso temporal.
+
+    Returns:
+        tuple: (T, Ti, Ts, C, historia) perfiles de temperatura al final del día, temperatura
+        interior y temperatura superficial interior de cada superficie (superficies, pasos
+        temporales) en cada paso, cambio medio de la última pasada y de cada pasada.
+    """
+    rhoair  = 1.1797660470258469
+    cair    = 1005.458757
+    ns, nt = Tsa.shape
+    P = np.zeros(k.shape)
+    c = np.zeros(k.shape)
+    den = np.ones(k.shape)
+    cap = np.zeros(k.shape)
+    for s in range(ns):
+        n = nx[s]
+        P[s, :n], c[s, :n], den[s, :n], cap[s, :n] = factorize_TDMA(dt, dx[s, :n], k[s, :n], n, rhoc[s, :n], ho, hi)
+
+    Q = np.zeros(k.shape[1])
+    Told = np.zeros(k.shape[1])
+    Ts = np.zeros((ns, nt))
+    area_total = area.sum()
+    nodos = nx.sum()
+    historia = np.empty(64)
+
+    C = 1.0
+    iteraciones = 0
+    while C > 5e-4:
+        cambio = 0.0
+        for s in range(ns):
+            n = nx[s]
+            factor = TDMAFactor(P[s, :n], c[s, :n], den[s, :n], cap[s, :n])
+            Told[:n] = T[s, :n]
+            for j in range(nt):
+                # Solo se usa el perfil; Ti se actualiza con todas las superficies
+                solve_factored(factor, T[s, :n], Tsa[s, j], ho, Ti[j], hi, n, La, dt, Q)
+                Ts[s, j] = T[s, n - 1]
+            cambio += np.abs(Told[:n] - T[s, :n]).sum()
+
+        for j in range(nt):
+            Tsup = 0.0
+            for s in range(ns):
+                Tsup += area[s] * Ts[s, j]
+            Tsup /= area_total
+            Ti[j] += hi * dt / (rhoair * cair * La) * (Tsup - Ti[j])
+        C = cambio / nodos
+
+        if iteraciones == historia.shape[0]:
+            anterior = historia
+            historia = np.empty(2*anterior.shape[0])
+            historia[:iteraciones] = anterior
+        historia[iteraciones] = C
+        iteraciones += 1
+
+    return T, Ti, Ts, C, historia[:iteraciones].copy()
+
+@njit(nogil=True, cache=True)
+def control_AC(Tint, Tmin, Tmax, La, dt):
+    """
+    Mantiene la temperatura interior dentro de la banda de confort [Tmin, Tmax] y calcula
+    el flujo de calor que el aire acondicionado entrega al aire del cuarto ficticio.
+
+    Args:
+        Tint (float): Temperatura interna sin control.
+        Tmin (float): Límite inferior de la banda (calefacción).
+        Tmax (float): Límite superior de la banda (enfriamiento).
+        La (float): Longitud del cuarto ficticio.
+        dt (float): Paso temporal.
+
+    Returns:
+        tuple: (Tint, Qac) temperatura interna controlada y flujo del aire acondicionado en
+        W/m², positivo al calentar y negativo al enfriar.
+    """
+    rhoair  = 1.1797660470258469
+    cair    = 1005.458757
+    Tcontrol = min(max(Tint, Tmin), Tmax)
+    return Tcontrol, rhoair * cair * La / dt * (Tcontrol - Tint)
+
+@njit(nogil=True, cache=True)
+def solve_periodic_AC(Tsa, k, rhoc, dx, nx, T, Ti, Tmin, Tmax, ho, hi, La, dt):
+    """
+    Resuelve el día promedio de forma periódica como solve_periodic, con la temperatura
+    interior controlada por aire acondicionado dentro de la banda [Tmin, Tmax]. El flujo
+    del muro, el del aire acondicionado y la energía de enfriamiento y calefacción del
+    día se acumulan dentro del mismo ciclo.
+
+    Args:
+        Tsa (numpy.ndarray): Temperatura sol-aire en cada paso temporal.
+        k (numpy.ndarray): Arreglo de conductividades.
+        rhoc (numpy.ndarray): Arreglo del producto de densidad y calor específico.
+        dx (float or numpy.ndarray): Tamaño de los volúmenes de control.
+        nx (int): Número de elementos de discretización.
+        T (numpy.ndarray): Perfil inicial de temperaturas, se actualiza in situ.
+        Ti (numpy.ndarray): Temperatura interior inicial en cada paso temporal, se actualiza in situ.
+        Tmin (numpy.ndarray): Límite inferior de la banda de confort en cada paso temporal.
+        Tmax (numpy.ndarray): Límite superior de la banda de confort en cada paso temporal.
+        ho (float): Coeficiente convectivo en el exterior.
+        hi (float): Coeficiente convectivo en el interior.
+        La (float): Longitud del cuarto ficticio.
+        dt (float): Paso temporal.
 
     Returns:
-        tuple: ( T, Tint, Qin, Tintaverage, Ein ) arreglos de temperaturas y parámetros actualizados.
+        tuple: (T, Ti, Qin, Qac, enfriamiento, calefaccion, C, historia) como solve_periodic,
+        más el flujo del muro al cuarto y el del aire acondicionado en cada paso (W/m²) y la
+        energía de enfriamiento y de calefacción del día (Wh/m²).
     """
-    return solve_PQ(a, b, c, d, T, nx, Tint, hi, La, dt)
\ No newline at end of file
+    factor = factorize_TDMA(dt, dx, k, nx, rhoc, ho, hi)
+    nt = Tsa.shape[0]
+    Q = np.zeros(nx)
+    Told = np.zeros(nx)
+    Qin = np.zeros(nt)
+    Qac = np.zeros(nt)
+    historia = np.empty(64)
+
+    C = 1.0
+    iteraciones = 0
+    enfriamiento = 0.0
+    calefaccion = 0.0
+    while C > 5e-4:
+        Told[:] = T
+        enfriamiento = 0.0
+        calefaccion = 0.0
+        for j in range(nt):
+            Tinn = Ti[j]
+            Tint = solve_factored(factor, T, Tsa[j], ho, Tinn, hi, nx, La, dt, Q)
+            Qin[j] = hi * (T[nx - 1] - Tinn)
+            Ti[j], Qac[j] = control_AC(Tint, Tmin[j], Tmax[j], La, dt)
+            if Qac[j] < 0:
+                enfriamiento -= Qac[j] * dt / 3600
+            else:
+                calefaccion += Qac[j] * dt / 3600
+        C = np.abs(Told - T).mean()
+
+        if iteraciones == historia.shape[0]:
+            anterior = historia
+            historia = np.empty(2*anterior.shape[0])
+            historia[:iteraciones] = anterior
+        historia[iteraciones] = C
+        iteraciones += 1
+
+    return T, Ti, Qin, Qac, enfriamiento, calefaccion, C, historia[:iteraciones].copy()
+
+@njit(parallel=True, nogil=True, cache=True)
+def solve_periodic_AC_batch(Tsa, k, rhoc, dx, nx, T, Ti, Tmin, Tmax, ho, hi, La, dt):
+    """
+    Resuelve varios sistemas constructivos en paralelo con solve_periodic_AC, un sistema por hilo.
+
+    Args:
+        Tsa (numpy.ndarray): Temperatura sol-aire, arreglo (sistemas, pasos temporales).
+        k (numpy.ndarray): Conductividades, arreglo (sistemas, volúmenes) como en stack_profiles.
+        rhoc (numpy.ndarray): Producto de densidad y calor específico, arreglo (sistemas, volúmenes).
+        dx (numpy.ndarray): Tamaño de los volúmenes de control, arreglo (sistemas, volúmenes).
+        nx (numpy.ndarray): Número de volúmenes de cada sistema.
+        T (numpy.ndarray): Perfiles iniciales de temperatura (sistemas, volúmenes), se actualizan in situ.
+        Ti (numpy.ndarray): Temperaturas interiores iniciales (sistemas, pasos temporales), se actualizan in situ.
+        Tmin (numpy.ndarray): Límite inferior de la banda de confort (sistemas, pasos temporales).
+        Tmax (numpy.ndarray): Límite superior de la banda de confort (sistemas, pasos temporales).
+        ho (float): Coeficiente convectivo en el exterior.
+        hi (float): Coeficiente convectivo en el interior.
+        La (float): Longitud del cuarto ficticio.
+        dt (float): Paso temporal.
+
+    Returns:
+        tuple: (T, Ti, Qin, Qac, enfriamiento, calefaccion) perfiles, temperaturas interiores y
+        flujos (sistemas, pasos temporales) y energías del día de cada sistema (Wh/m²).
+    """
+    ns, nt = Tsa.shape
+    Qin = np.zeros((ns, nt))
+    Qac = np.zeros((ns, nt))
+    enfriamiento = np.zeros(ns)
+    calefaccion = np.zeros(ns)
+    for s in prange(ns):
+        n = nx[s]
+        _, _, Qin[s], Qac[s], enfriamiento[s], calefaccion[s], _, _ = solve_periodic_AC(
+            Tsa[s], k[s, :n], rhoc[s, :n], dx[s, :n], n, T[s, :n], Ti[s], Tmin[s], Tmax[s], ho, hi, La, dt)
+
+    return T, Ti, Qin, Qac, enfriamiento, calefaccion
+
+def comfort_band(df, setpoint=None):
+    """
+    Banda de confort del aire acondicionado en cada paso temporal del DataFrame.
+
+    Args:
+        df (pd.DataFrame): DataFrame en los pasos temporales del solver.
+        setpoint (float or tuple, optional): Temperatura fija, o límites (inferior, superior).
+            Por omisión la banda es Tn ± DeltaTn de meanDay.
+
+    Returns:
+        tuple: (Tmin, Tmax) arreglos con los límites en cada paso temporal.
+    """
+    n = len(df.index)
+    if setpoint is None:
+        if 'Tn' not in df or 'DeltaTn' not in df:
+            raise ValueError("The Tsa DataFrame needs Tn and DeltaTn for the default comfort band, or pass a setpoint")
+        Tn = df['Tn'].to_numpy(dtype=np.float64)
+        DeltaTn = df['DeltaTn'].to_numpy(dtype=np.float64)
+        return Tn - DeltaTn, Tn + DeltaTn
+    Tmin, Tmax = (setpoint, setpoint) if np.isscalar(setpoint) else setpoint
+    if Tmin > Tmax:
+        raise ValueError("The lower setpoint must not exceed the upper setpoint")
+    return np.full(n, float(Tmin)), np.full(n, float(Tmax))
+"""
+=============================
+      Harmonic tools
+=============================
+"""
+
+def transfer_matrix(cs, omega, ho, hi):
+    """
+    Calcula la matriz de transmisión del sistema constructivo, de la temperatura sol-aire
+    a la superficie interior más la película convectiva interior, para cada frecuencia.
+
+    Args:
+        cs (dict): Diccionario con la configuración del sistema constructivo.
+        omega (numpy.ndarray): Frecuencias angulares en rad/s.
+        ho (float): Coeficiente convectivo en el exterior.
+        hi (float): Coeficiente convectivo en el interior.
+
+    Returns:
+        tuple: (A, B, C, D) arreglos complejos con los elementos de la matriz 2x2 para cada
+        frecuencia, tal que [T_exterior, q_exterior] = [[A, B], [C, D]] [T_interior, q_interior].
+        attenuation (numpy.ndarray): Suma de Re(gamma*L) de las capas, útil para descartar
+        armónicos que el muro amortigua por completo.
+    """
+    omega = np.asarray(omega, dtype=np.float64)
+    A = np.ones(omega.shape, dtype=np.complex128)
+    B = np.full(omega.shape, 1.0 / ho, dtype=np.complex128)
+    C = np.zeros(omega.shape, dtype=np.complex128)
+    D = np.ones(omega.shape, dtype=np.complex128)
+    attenuation = np.zeros(omega.shape)
+
+    for L in cs.keys():
+        L_value = cs[L]['L']
+        k_value = cs[L]['material'].k
+        rhoc_value = cs[L]['material'].rho * cs[L]['material'].c
+
+        gamma = np.sqrt(1j * omega * rhoc_value / k_value)
+        gL = gamma * L_value
+        attenuation += gL.real
+        with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+            ch = np.cosh(gL)
+            sh = np.sinh(gL)
+            a11 = ch
+            a12 = np.where(omega > 0, sh / (k_value * gamma), L_value / k_value)
+            a21 = k_value * gamma * sh
+            A, B, C, D = A*a11 + B*a21, A*a12 + B*ch, C*a11 + D*a21, C*a12 + D*ch
+
+    # Película convectiva interior
+    B = A / hi + B
+    D = C / hi + D
+
+    return A, B, C, D, attenuation
+
+def harmonic_response(Tsa, cs, ho, hi, dt):
+    """
+    Calcula la temperatura interior periódica en el dominio de la frecuencia. La señal Tsa
+    se descompone con la FFT y cada armónico se propaga con la matriz de transmisión del muro.
+    Igual que en el estado periódico de solve_periodic, la temperatura interior es la de la
+    superficie interior y no hay flujo neto hacia el aire.
+
+    Args:
+        Tsa (numpy.ndarray): Temperatura sol-aire periódica en cada paso temporal.
+        cs (dict): Diccionario con la configuración del sistema constructivo.
+        ho (float): Coeficiente convectivo en el exterior.
+        hi (float): Coeficiente convectivo en el interior.
+        dt (float): Paso temporal.
+
+    Returns:
+        numpy.ndarray: Temperatura interior en cada paso temporal.
+    """
+    nt = len(Tsa)
+    Tsa_hat = np.fft.rfft(Tsa)
+    omega = 2 * np.pi * np.fft.rfftfreq(nt, d=dt)
+
+    A, B, C, D, attenuation = transfer_matrix(cs, omega, ho, hi)
+    # Armónicos amortiguados más allá de la precisión numérica
+    damped = attenuation > 300
+    with np.errstate(over='ignore', invalid='ignore'):
+        Ti_hat = Tsa_hat / A
+    Ti_hat[damped] = 0.0
+
+    return np.fft.irfft(Ti_hat, n=nt)
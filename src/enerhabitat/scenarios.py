@@ -0,0 +1,136 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import concurrent.futures as cf
+
+import enerhabitat as eh
+
+"""
+=============================
+      Scenario runner
+=============================
+"""
+
+_COLUMNAS = ['Ta', 'Tn', 'Ib', 'Ig', 'Id', 'zenith', 'azimuth']
+_compartido = {}    # Arreglos publicados por el proceso principal, uno por proceso trabajador
+
+def run_scenarios(
+    scenarios:list,
+    workers = None,
+    day = "15",
+    year = "current_year",
+    chunksize = 16,
+    config = None
+    ):
+    """
+    Runs the meanDay -> Tsa -> solveCS pipeline for many scenarios spread across processes.
+
+    Every (EPW file, month) average day and every constructive system is computed once in
+    the main process and published to the workers as memory-mapped arrays, so jobs only
+    carry a few indices. The average days are computed at the solver time step ( dt ).
+
+    Args:
+        scenarios (list): tuples (epw_file, month, (surface_tilt, surface_azimuth), solar_absortance,
+            constructive_system).
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs,
+            1 runs everything in the current process.
+        day (str, optional): Day of interest. Defaults to 15.
+        year (str, optional): Year of interest. Defaults to current year.
+        chunksize (int, optional): Scenarios sent to a worker at a time. Defaults to 16.
+        config (SimulationConfig, optional): Simulation configuration. Defaults to the module values.
+
+    Yields:
+        tuple: (i, Ti) position of the scenario in the list and its interior temperature
+        ( Ti ) at the solver time steps, in completion order.
+    """
+    scenarios = list(scenarios)
+    workers = os.cpu_count() if workers is None else workers
+    config = eh._config(config)
+
+    # Días promedio, una lectura del EPW por archivo
+    climas = {}
+    for epw_file in dict.fromkeys(s[0] for s in scenarios):
+        months = sorted({int(s[1]) for s in scenarios if s[0] == epw_file})
+        dias = eh.meanYear(epw_file, months, day, year, resolution=config.dt, config=config)
+        for month in months:
+            climas[(epw_file, month)] = dias[month]
+
+    # Perfiles de los sistemas constructivos, una lectura de materiales
+    propiedades = config.properties()
+    sistemas = {}
+    for s in scenarios:
+        sistemas.setdefault(tuple(tuple(capa) for capa in s[4]), len(sistemas))
+
+    claves_clima = {clave: n for n, clave in enumerate(climas)}
+    trabajos = [(i, claves_clima[(s[0], int(s[1]))], sistemas[tuple(tuple(capa) for capa in s[4])],
+                 float(s[2][0]), float(s[2][1]), float(s[3]))
+                for i, s in enumerate(scenarios)]
+
+    with tempfile.TemporaryDirectory(prefix="enerhabitat-") as directorio:
+        clima = np.stack([np.stack([df[c].to_numpy(dtype=np.float64) for c in _COLUMNAS]) for df in climas.values()])
+        k, rhoc, dx, nodos = eh.stack_profiles(propiedades, list(sistemas), config.Nx, config.mesh)
+
+        rutas = {}
+        for nombre, arreglo in [('clima', clima), ('k', k), ('rhoc', rhoc), ('dx', dx), ('nodos', nodos)]:
+            rutas[nombre] = os.path.join(directorio, f'{nombre}.npy')
+            np.save(rutas[nombre], arreglo)
+
+        bloques = [trabajos[i:i + chunksize] for i in range(0, len(trabajos), chunksize)]
+
+        if workers == 1:
+            _init_worker(rutas, config)
+            for bloque in bloques:
+                yield from _run_chunk(bloque)
+            return
+
+        with cf.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                    initargs=(rutas, config)) as pool:
+            pendientes = set()
+            bloques = iter(bloques)
+            # Número acotado de bloques en vuelo para no crear todos los futuros a la vez
+            for bloque in bloques:
+                pendientes.add(pool.submit(_run_chunk, bloque))
+                if len(pendientes) >= 4 * workers:
+                    break
+            while pendientes:
+                terminados, pendientes = cf.wait(pendientes, return_when=cf.FIRST_COMPLETED)
+                for futuro in terminados:
+                    yield from futuro.result()
+                    bloque = next(bloques, None)
+                    if bloque is not None:
+                        pendientes.add(pool.submit(_run_chunk, bloque))
+
+def _init_worker(rutas, config):
+    """
+    Abre los arreglos publicados por el proceso principal y guarda la configuración.
+    """
+    for nombre, ruta in rutas.items():
+        _compartido[nombre] = np.load(ruta, mmap_mode='r')
+    _compartido['config'] = config
+
+def _run_chunk(bloque):
+    """
+    Resuelve un bloque de escenarios con los arreglos publicados.
+
+    Returns:
+        list: (i, Ti) de cada escenario del bloque.
+    """
+    clima = _compartido['clima']
+    config = _compartido['config']
+    resultados = []
+    for i, n_clima, n_sistema, tilt, azimuth, absortance in bloque:
+        dia = pd.DataFrame(dict(zip(_COLUMNAS, clima[n_clima])))
+        _, Tsa = eh.Tsa_grid(dia, absortance, tilt, azimuth, config=config)
+        Tsa = np.ascontiguousarray(Tsa[0, 0])
+
+        Tn = dia.Tn.mean()
+        nx = int(_compartido['nodos'][n_sistema])
+        T = np.full(nx, Tn)
+        Ti = np.full(len(Tsa), Tn)
+        T, Ti, _, _ = eh.solve_periodic(Tsa, np.asarray(_compartido['k'][n_sistema, :nx]),
+                                        np.asarray(_compartido['rhoc'][n_sistema, :nx]),
+                                        np.asarray(_compartido['dx'][n_sistema, :nx]),
+                                        nx, T, Ti, config.ho, config.hi, config.La, config.dt)
+        resultados.append((i, Ti))
+    return resultados